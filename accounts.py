@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Optional
+
+from http_transport import Transport
+from position_sizer import STATE_FILE
+from reporting import REPORT_FILE
+from scheduler import Scheduler
+from trading_bot import TradingBot
+
+logger = logging.getLogger("accounts")
+
+
+def account_ids_from_env() -> list[str]:
+    """OANDA_ACCOUNT_IDS (comma separated), falling back to the single OANDA_ACCOUNT_ID."""
+    ids = [a.strip() for a in os.getenv("OANDA_ACCOUNT_IDS", "").split(",") if a.strip()]
+    if not ids and os.getenv("OANDA_ACCOUNT_ID"):
+        ids = [os.environ["OANDA_ACCOUNT_ID"]]
+    if not ids:
+        raise ValueError("OANDA_ACCOUNT_IDS or OANDA_ACCOUNT_ID must be set in environment variables.")
+    return list(dict.fromkeys(ids))
+
+
+def account_file(path: str, account_id: str) -> str:
+    """trade_state.json -> trade_state.<account_id>.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{account_id}{ext}"
+
+
+def shard(account_ids: list[str], workers: int) -> list[list[str]]:
+    """Split accounts round-robin into at most `workers` non-empty groups."""
+    workers = max(1, min(workers, len(account_ids)))
+    return [account_ids[i::workers] for i in range(workers)]
+
+
+class AccountRegistry:
+    """One isolated TradingBot stack per account, all on one event loop.
+
+    The stacks share a single Transport (connection pool and rate limit, which OANDA
+    applies per login rather than per account), one price feed and the candle store;
+    each keeps its own sizer, closer, reconciler and state files. With a single account
+    the legacy state file names are kept. Pass per_account when this registry holds one
+    shard of a larger deployment: the naming must follow the full account list, or the
+    shards' one-account registries would all share the legacy files.
+    """
+
+    def __init__(self, account_ids: list[str], state_file: Optional[str] = STATE_FILE,
+                 report_file: Optional[str] = REPORT_FILE, transport: Optional[Transport] = None,
+                 per_account: Optional[bool] = None):
+        if not account_ids:
+            raise ValueError("AccountRegistry needs at least one account")
+        self.bots: dict[str, TradingBot] = {}
+        if per_account is None:
+            per_account = len(account_ids) > 1
+        shared = {"transport": transport} if transport is not None else {}
+        for i, account_id in enumerate(account_ids):
+            bot = TradingBot(
+                state_file=account_file(state_file, account_id) if state_file and per_account else state_file,
+                report_file=account_file(report_file, account_id) if report_file and per_account else report_file,
+                account_id=account_id,
+                primary=i == 0,
+                **shared,
+            )
+            if i == 0:
+                # The first stack builds the shared pieces; later ones reuse them
+                shared = {
+                    "transport": bot.oanda.transport,
+                    "price_feed": bot.oanda.price_feed,
+                    "candle_store": bot.candle_store,
+                }
+            self.bots[account_id] = bot
+        self.transport = shared["transport"]
+        self.started = False
+
+    @property
+    def primary(self) -> TradingBot:
+        return next(iter(self.bots.values()))
+
+    def __len__(self):
+        return len(self.bots)
+
+    def resolve(self, target: Optional[str] = None) -> list[TradingBot]:
+        """Bots matching an account id, a unique id suffix or a 1-based index; all for None/'all'."""
+        if target is None or target.lower() == "all":
+            return list(self.bots.values())
+        if target in self.bots:
+            return [self.bots[target]]
+        ids = list(self.bots)
+        if target.isdigit() and 1 <= int(target) <= len(ids):
+            return [self.bots[ids[int(target) - 1]]]
+        matches = [bot for account_id, bot in self.bots.items() if account_id.endswith(target)]
+        return matches if len(matches) == 1 else []
+
+    async def start(self, scheduler: Optional[Scheduler] = None):
+        # Stacks warm up concurrently; the shared transport and price feed are opened by whichever starts first
+        await asyncio.gather(*(bot.start(scheduler) for bot in self.bots.values()))
+        self.started = True
+
+    async def stop(self):
+        # Secondaries first; the primary owns the shared transport and price feed
+        for bot in reversed(list(self.bots.values())):
+            await bot.stop()
+        self.started = False
+
+
+async def _serve(account_ids: list[str], per_account: bool):
+    registry = AccountRegistry(account_ids, per_account=per_account)
+    scheduler = Scheduler()
+    await registry.start(scheduler)
+    scheduler.start()
+    logger.info(f"Worker {os.getpid()} trading accounts {', '.join(account_ids)}")
+    stopped = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await scheduler.stop()
+        await registry.stop()
+
+
+def run_worker(account_ids: list[str], index: int, per_account: bool = True):
+    """Entry point of a worker process: trades its shard of accounts headless until SIGTERM.
+
+    per_account selects per-account state file names; shards of a multi-account
+    deployment always use them, even when a shard holds a single account.
+    """
+    logging.basicConfig(level=logging.INFO)
+    metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+    if metrics_port:
+        # Each worker exposes its own endpoint next to the main process's
+        os.environ["METRICS_PORT"] = str(metrics_port + index)
+    asyncio.run(_serve(account_ids, per_account))
@@ -0,0 +1,62 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+
+class BackgroundTask:
+    """A component driven by one long-lived asyncio task running _run().
+
+    start() is idempotent and restarts a task that has finished; stop() cancels it and
+    waits for it to unwind.
+    """
+
+    task_name = "background"
+    _task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=self.task_name)
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _run(self):
+        raise NotImplementedError
+
+
+class Backoff:
+    """Jittered exponential delay between reconnects.
+
+    Call attempt() when a connection starts; sleep() waits before the next one. The delay
+    resets once a connection has stayed up for longer than the maximum delay.
+    """
+
+    def __init__(self, minimum: float, maximum: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.delay = minimum
+        self._started = time.monotonic()
+
+    def attempt(self):
+        self._started = time.monotonic()
+
+    def reset(self):
+        self.delay = self.minimum
+
+    async def sleep(self):
+        if time.monotonic() - self._started > self.maximum:
+            self.reset()
+        await asyncio.sleep(self.delay * (0.5 + random.random() / 2))
+        self.delay = min(self.delay * 2, self.maximum)
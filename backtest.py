@@ -0,0 +1,361 @@
+"""Offline backtests: replay stored OANDA candles or ticks through the live decision code.
+
+PositionSizer, TradeExecutor, TradeCloser, ExitEngine and InstrumentSelector run
+unchanged against BacktestClient, which stands in for OandaClient with simulated
+fills, margin and P/L. Replayed quotes go through a PriceFeed exactly as streamed
+ones do live, and the sizer and closer clocks follow simulated time.
+
+    python backtest.py data/EUR_USD_M1.json data/GBP_USD_M1.json \
+        --grid trailing_stop_pips=10,15,20 --grid stop_loss_pips=8,10 --processes 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+
+from instrument_selector import InstrumentSelector
+from position_sizer import PositionSizer
+from price_feed import PriceFeed
+from trade_closer import ExitEngine, TradeCloser, parse_oanda_time
+from trade_executor import TradeExecutor
+
+logger = logging.getLogger("backtest")
+
+DEFAULT_PARAMS = {
+    "stop_loss_pips": 10.0,
+    "trailing_stop_pips": 15,
+    "min_profit_threshold": 3.0,
+    "max_trade_duration_minutes": 120,
+    "min_risk": 0.01,
+    "max_risk": 0.03,
+    "max_open_trades": 100,
+    "trade_cooldown_minutes": 0.0,
+}
+
+
+def _epoch(time_str: str) -> float:
+    if time_str.replace(".", "", 1).isdigit():
+        return float(time_str)
+    return parse_oanda_time(time_str).timestamp()
+
+
+def load_series(path: str, spread_pips: float = 1.0) -> tuple[str, np.ndarray, np.ndarray, np.ndarray]:
+    """Load an OANDA candles response (JSON) or a pricing stream capture (JSON lines).
+
+    Returns (instrument, times, bids, asks) as float64 arrays sorted by time.
+    Candles with only mid prices get a synthetic spread of spread_pips.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        doc = None
+
+    if isinstance(doc, dict) and "candles" in doc:
+        instrument = doc["instrument"]
+        candles = [c for c in doc["candles"] if c.get("complete", True)]
+        times = np.array([_epoch(c["time"]) for c in candles], dtype=np.float64)
+        if candles and "bid" in candles[0] and "ask" in candles[0]:
+            bids = np.array([float(c["bid"]["c"]) for c in candles], dtype=np.float64)
+            asks = np.array([float(c["ask"]["c"]) for c in candles], dtype=np.float64)
+        else:
+            mids = np.array([float(c["mid"]["c"]) for c in candles], dtype=np.float64)
+            half_spread = spread_pips * (0.01 if instrument.endswith("JPY") else 0.0001) / 2
+            bids = mids - half_spread
+            asks = mids + half_spread
+    else:
+        ticks = [json.loads(line) for line in text.splitlines() if line.strip()]
+        ticks = [t for t in ticks if t.get("type", "PRICE") == "PRICE"]
+        instrument = ticks[0]["instrument"]
+        times = np.array([_epoch(t["time"]) for t in ticks], dtype=np.float64)
+        bids = np.array([float(t["bids"][0]["price"]) for t in ticks], dtype=np.float64)
+        asks = np.array([float(t["asks"][0]["price"]) for t in ticks], dtype=np.float64)
+
+    order = np.argsort(times, kind="stable")
+    return instrument, times[order], bids[order], asks[order]
+
+
+def align(series: list[tuple[str, np.ndarray, np.ndarray, np.ndarray]]):
+    """Put every instrument on the union timeline, forward-filling the last known quote."""
+    instruments = [s[0] for s in series]
+    timeline = np.unique(np.concatenate([s[1] for s in series]))
+    bids = np.full((len(timeline), len(series)), np.nan)
+    asks = np.full((len(timeline), len(series)), np.nan)
+    for j, (_, times, bid, ask) in enumerate(series):
+        idx = np.searchsorted(times, timeline, side="right") - 1
+        valid = idx >= 0
+        bids[valid, j] = bid[idx[valid]]
+        asks[valid, j] = ask[idx[valid]]
+    return instruments, timeline, bids, asks
+
+
+def _conversion(instruments: list[str], mids: np.ndarray, account_currency: str) -> np.ndarray:
+    """Per-step factor converting each instrument's quote-currency P/L into the account currency."""
+    factors = np.ones_like(mids)
+    index = {inst: j for j, inst in enumerate(instruments)}
+    for j, inst in enumerate(instruments):
+        base, quote = inst.split("_")
+        if quote == account_currency:
+            continue
+        if base == account_currency:
+            factors[:, j] = 1 / mids[:, j]
+        elif f"{account_currency}_{quote}" in index:
+            factors[:, j] = 1 / mids[:, index[f"{account_currency}_{quote}"]]
+        elif f"{quote}_{account_currency}" in index:
+            factors[:, j] = mids[:, index[f"{quote}_{account_currency}"]]
+    return np.nan_to_num(factors, nan=1.0)
+
+
+class BacktestClient:
+    """Drop-in OandaClient replacement that fills market orders against replayed quotes."""
+
+    def __init__(self, instruments, timeline, bids, asks, balance=10_000.0, margin_rate=0.0333,
+                 account_currency="USD"):
+        self.account_id = "backtest"
+        self.instruments = instruments
+        self.index = {inst: j for j, inst in enumerate(instruments)}
+        self.timeline = timeline
+        self.bids = bids
+        self.asks = asks
+        self.mids = (bids + asks) / 2
+        self.conversion = _conversion(instruments, self.mids, account_currency)
+        self.margin_rate = margin_rate
+        self.balance = balance
+        self.step = 0
+        self.trades = {}
+        self.next_id = 1
+        self.requests = 0
+        # Net open units and entry cost per instrument, for vectorized mark-to-market
+        self.net_units = np.zeros(len(instruments))
+        self.net_cost = np.zeros(len(instruments))
+        self.closed = []  # realized P/L per closed trade
+        # Never started: run_backtest publishes the replayed quotes into it
+        self.price_feed = PriceFeed(None, "", self.account_id, instruments)
+
+    @property
+    def sim_time(self) -> float:
+        return float(self.timeline[self.step])
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.sim_time, timezone.utc)
+
+    def _quote(self, instrument) -> Optional[tuple[float, float]]:
+        j = self.index.get(instrument)
+        if j is None or np.isnan(self.bids[self.step, j]):
+            return None
+        return float(self.bids[self.step, j]), float(self.asks[self.step, j])
+
+    def unrealized(self) -> float:
+        mids = np.nan_to_num(self.mids[self.step])
+        return float(((self.net_units * mids - self.net_cost) * self.conversion[self.step]).sum())
+
+    def margin_used(self) -> float:
+        mids = np.nan_to_num(self.mids[self.step])
+        return float((np.abs(self.net_units) * mids * self.conversion[self.step]).sum() * self.margin_rate)
+
+    async def create_trade(self, instrument: str, units: int):
+        self.requests += 1
+        quote = self._quote(instrument)
+        if quote is None:
+            return False, {"errorMessage": f"no price for {instrument}"}
+        price = quote[1] if units > 0 else quote[0]
+        j = self.index[instrument]
+        margin = abs(units) * price * self.conversion[self.step, j] * self.margin_rate
+        if margin > self.balance + self.unrealized() - self.margin_used():
+            return False, {"errorMessage": "INSUFFICIENT_MARGIN"}
+        trade_id = str(self.next_id)
+        self.next_id += 1
+        self.trades[trade_id] = {"instrument": instrument, "units": units, "price": price, "open": self.sim_time}
+        self.net_units[j] += units
+        self.net_cost[j] += units * price
+        return True, {"orderFillTransaction": {"tradeOpened": {"tradeID": trade_id, "units": str(units)}, "price": str(price)}}
+
+    async def close_trade(self, trade_id: str):
+        self.requests += 1
+        trade = self.trades.pop(trade_id, None)
+        if trade is None:
+            return False, {"errorMessage": "TRADE_DOESNT_EXIST"}
+        bid, ask = self._quote(trade["instrument"])
+        units = trade["units"]
+        price = bid if units > 0 else ask
+        j = self.index[trade["instrument"]]
+        pl = units * (price - trade["price"]) * self.conversion[self.step, j]
+        self.balance += pl
+        self.net_units[j] -= units
+        self.net_cost[j] -= units * trade["price"]
+        self.closed.append(pl)
+        return True, {"orderFillTransaction": {"pl": str(pl), "price": str(price)}}
+
+    async def create_trades(self, orders: list[tuple[str, int]], max_concurrency: int = 8):
+        return [await self.create_trade(instrument, units) for instrument, units in orders]
+
+    async def close_trades(self, trade_ids: list[str], open_trades=None, max_concurrency: int = 8):
+        return [await self.close_trade(trade_id) for trade_id in trade_ids]
+
+    async def get_price(self, instrument: str) -> Optional[float]:
+        self.requests += 1
+        quote = self._quote(instrument)
+        return None if quote is None else (quote[0] + quote[1]) / 2
+
+    async def get_prices(self, instruments: list[str]) -> dict[str, float]:
+        self.requests += 1
+        prices = {}
+        for instrument in instruments:
+            quote = self._quote(instrument)
+            if quote is not None:
+                prices[instrument] = (quote[0] + quote[1]) / 2
+        return prices
+
+    async def get_account_summary(self) -> dict:
+        self.requests += 1
+        nav = self.balance + self.unrealized()
+        return {
+            "balance": str(self.balance),
+            "NAV": str(nav),
+            "marginAvailable": str(max(0.0, nav - self.margin_used())),
+            "openTradeCount": len(self.trades),
+        }
+
+    async def get_account_balance(self) -> Optional[float]:
+        return float((await self.get_account_summary())["balance"])
+
+    async def get_margin_available(self) -> Optional[float]:
+        return float((await self.get_account_summary())["marginAvailable"])
+
+    async def get_open_trades(self) -> list[dict]:
+        self.requests += 1
+        trades = []
+        for trade_id, t in self.trades.items():
+            j = self.index[t["instrument"]]
+            mid = self.mids[self.step, j]
+            pl = t["units"] * (mid - t["price"]) * self.conversion[self.step, j]
+            trades.append({
+                "id": trade_id,
+                "instrument": t["instrument"],
+                "price": str(t["price"]),
+                "currentUnits": str(t["units"]),
+                "openTime": datetime.fromtimestamp(t["open"], timezone.utc).isoformat().replace("+00:00", "Z"),
+                "unrealizedPL": str(pl),
+                "initialMarginRequired": str(abs(t["units"]) * t["price"] * self.conversion[self.step, j] * self.margin_rate),
+            })
+        return trades
+
+
+async def run_backtest(instruments, timeline, bids, asks, params: Optional[dict] = None, balance=10_000.0,
+                       decision_every: int = 1, seed: int = 0) -> dict:
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    random.seed(seed)
+    client = BacktestClient(instruments, timeline, bids, asks, balance=balance)
+    sizer = PositionSizer(client, min_risk=params["min_risk"], max_risk=params["max_risk"],
+                          max_open_trades=params["max_open_trades"], state_file=None)
+    sizer.trade_cooldown_minutes = params["trade_cooldown_minutes"]
+    sizer.clock = lambda: client.now().replace(tzinfo=None)
+    selector = InstrumentSelector(instruments)
+    sizer.selector = selector
+    executor = TradeExecutor(client, sizer)
+    closer = TradeCloser(client, sizer)
+    closer.trailing_stop_pips = params["trailing_stop_pips"]
+    closer.min_profit_threshold = params["min_profit_threshold"]
+    closer.max_trade_duration = timedelta(minutes=params["max_trade_duration_minutes"])
+    closer.clock = client.now
+    # Same wiring as TradingBot: the selector and the exit engine both listen to the feed
+    engine = ExitEngine(client, closer)
+    client.price_feed.subscribe(selector.update)
+    engine.start(run_loop=False)
+
+    equity = np.empty(len(timeline))
+    opened = 0
+    for step in range(len(timeline)):
+        client.step = step
+        for j, instrument in enumerate(instruments):
+            if not np.isnan(bids[step, j]):
+                client.price_feed.update(instrument, float(bids[step, j]), float(asks[step, j]))
+        # Closes triggered by this step's ticks fill at this step's prices
+        await engine.drain()
+        if step % decision_every == 0:
+            instrument = selector.choose()
+            if instrument in client.index:
+                units = await sizer.calculate_units(instrument, params["stop_loss_pips"])
+                if await executor.execute_trade(instrument, units):
+                    opened += 1
+                    # Index the new trade, as TradingBot.run() does after placing
+                    await engine.refresh()
+        equity[step] = client.balance + client.unrealized()
+    await engine.stop()
+
+    return {"params": params, **summarize(equity, np.array(client.closed), balance), "opened": opened,
+            "requests": client.requests}
+
+
+def summarize(equity: np.ndarray, closed: np.ndarray, starting_balance: float) -> dict:
+    if len(equity) == 0:
+        return {"pnl": 0.0, "max_drawdown": 0.0, "closed": 0, "wins": 0, "losses": 0}
+    peak = np.maximum.accumulate(np.maximum(equity, starting_balance))
+    drawdown = (peak - equity) / peak
+    return {
+        "pnl": float(equity[-1] - starting_balance),
+        "max_drawdown": float(drawdown.max()),
+        "closed": int(len(closed)),
+        "wins": int((closed > 0).sum()),
+        "losses": int((closed <= 0).sum()),
+    }
+
+
+def _run_one(args):
+    aligned, params, balance, decision_every, seed = args
+    logging.getLogger().setLevel(logging.WARNING)
+    return asyncio.run(run_backtest(*aligned, params=params, balance=balance,
+                                    decision_every=decision_every, seed=seed))
+
+
+def run_grid(paths: list[str], grid: dict[str, list], processes: Optional[int] = None, balance=10_000.0,
+             decision_every: int = 1, seed: int = 0) -> list[dict]:
+    """Run every parameter combination in grid across a process pool; results keep grid order."""
+    aligned = align([load_series(p) for p in paths])
+    keys = list(grid)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))] or [{}]
+    jobs = [(aligned, params, balance, decision_every, seed) for params in combos]
+    if processes == 1 or len(jobs) == 1:
+        return [_run_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_run_one, jobs))
+
+
+def _parse_grid(items: list[str]) -> dict[str, list]:
+    grid = {}
+    for item in items:
+        key, values = item.split("=", 1)
+        grid[key] = [float(v) for v in values.split(",")]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored OANDA prices through the trading logic")
+    parser.add_argument("files", nargs="+", help="OANDA candle JSON or pricing-stream JSON-lines files")
+    parser.add_argument("--grid", action="append", default=[], help="param=v1,v2,... (repeatable)")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--balance", type=float, default=10_000.0)
+    parser.add_argument("--decision-every", type=int, default=1, help="attempt an entry every N steps")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    grid = _parse_grid(args.grid)
+    results = run_grid(args.files, grid, processes=args.processes, balance=args.balance,
+                       decision_every=args.decision_every, seed=args.seed)
+    for r in sorted(results, key=lambda r: r["pnl"], reverse=True):
+        varied = {k: r["params"][k] for k in grid}
+        print(f"{varied} pnl={r['pnl']:.2f} dd={r['max_drawdown']:.2%} opened={r['opened']} "
+              f"closed={r['closed']} wins={r['wins']} losses={r['losses']}")
+
+
+if __name__ == "__main__":
+    main()
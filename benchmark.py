@@ -0,0 +1,196 @@
+"""Latency and request-count benchmarks against the local OANDA stand-in.
+
+    python benchmark.py --latency 0.02 --iterations 20
+    python benchmark.py --json > bench_output.txt
+    python benchmark.py --startup-only          # CI gate: exits non-zero over STARTUP_BUDGET
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from instrument_selector import CURRENCY_PAIRS
+from mock_oanda import MockOanda
+
+
+def _stats(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+async def _make_bot(mock: MockOanda):
+    os.environ["OANDA_API_KEY"] = "benchmark"
+    os.environ["OANDA_ACCOUNT_ID"] = "mock"
+    os.environ["OANDA_BASE_URL"] = mock.base_url
+    os.environ["OANDA_STREAM_URL"] = mock.base_url
+    from trading_bot import TradingBot
+
+    bot = TradingBot(state_file=None)
+    bot.position_sizer.trade_cooldown_minutes = 0
+    bot.position_sizer.max_open_trades = 1_000_000
+    return bot
+
+
+async def bench_maketrade(mock: MockOanda, iterations: int, stream: bool) -> dict:
+    """End-to-end TradingBot.run(): scan, size, place and post-trade monitoring."""
+    bot = await _make_bot(mock)
+    if stream:
+        bot.oanda.start_price_feed(CURRENCY_PAIRS)
+        await asyncio.sleep(mock.tick_interval * 2)
+    samples = []
+    requests_before = mock.request_count
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await bot.run()
+            samples.append(time.perf_counter() - started)
+    finally:
+        await bot.stop()
+    streamed = 1 if stream else 0  # the long-lived stream request is not per decision
+    return {**_stats(samples), "requests_per_decision": (mock.request_count - requests_before - streamed) / iterations}
+
+
+async def bench_monitor(mock: MockOanda, open_trades: int, iterations: int) -> dict:
+    """One TradeCloser.monitor_trades() pass over open_trades positions that all stay open."""
+    mock.trades.clear()
+    mock.seed_trades(open_trades)
+    bot = await _make_bot(mock)
+    samples = []
+    requests_before = mock.request_count
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await bot.trade_closer.monitor_trades()
+            samples.append(time.perf_counter() - started)
+    finally:
+        await bot.stop()
+    return {**_stats(samples), "open_trades": open_trades,
+            "requests_per_pass": (mock.request_count - requests_before) / iterations}
+
+
+# Median seconds from a fresh interpreter to exit monitoring live with STARTUP_TRADES open at
+# the default 20ms latency. Locally this takes ~0.4s; the margin absorbs slower CI machines.
+STARTUP_BUDGET = 2.0
+STARTUP_TRADES = 100
+
+# Child process for the startup benchmark: the bot_runner path up to the point where exits are guarded
+STARTUP_SCRIPT = """
+import asyncio
+from accounts import AccountRegistry, account_ids_from_env
+from scheduler import Scheduler
+
+async def main():
+    registry = AccountRegistry(account_ids_from_env())
+    scheduler = Scheduler()
+    await registry.start(scheduler)
+    bot = registry.primary
+    if bot.exit_engine.running and bot.reconciler.book.synced:
+        print("ready", len(bot.exit_engine.trades), flush=True)
+    await scheduler.stop()
+    await registry.stop()
+
+asyncio.run(main())
+"""
+
+
+async def bench_startup(mock: MockOanda, open_trades: int, runs: int) -> dict:
+    """Fresh interpreter to exit monitoring live, restarting on the state files the previous run left."""
+    mock.trades.clear()
+    mock.seed_trades(open_trades)
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.path.dirname(os.path.abspath(__file__)),
+            "OANDA_API_KEY": "benchmark",
+            "OANDA_ACCOUNT_ID": "mock",
+            "OANDA_BASE_URL": mock.base_url,
+            "OANDA_STREAM_URL": mock.base_url,
+            "CANDLE_STORE_DIR": os.path.join(workdir, "candles"),
+            "METRICS_PORT": "0",
+        }
+        for _ in range(runs):
+            started = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", STARTUP_SCRIPT, cwd=workdir, env=env,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+            line = await proc.stdout.readline()
+            elapsed = time.perf_counter() - started
+            await proc.wait()
+            fields = line.split()
+            if not fields or fields[0] != b"ready" or int(fields[1]) != open_trades:
+                raise RuntimeError(f"Startup run did not reach a synced exit engine (exit code {proc.returncode})")
+            samples.append(elapsed)
+    return {**_stats(samples), "open_trades": open_trades}
+
+
+async def run_benchmarks(latency: float, iterations: int, trade_counts: list[int],
+                         startup_runs: int = 3, startup_only: bool = False) -> dict:
+    # Keep prices still so the monitor benchmark never trips an exit rule
+    mock = MockOanda(latency=latency, volatility=0.0, seed=1)
+    await mock.start()
+    try:
+        results = {"latency_s": latency}
+        if not startup_only:
+            results["maketrade_rest"] = await bench_maketrade(mock, iterations, stream=False)
+            results["maketrade_stream"] = await bench_maketrade(mock, iterations, stream=True)
+            results["monitor"] = [await bench_monitor(mock, n, iterations) for n in trade_counts]
+        results["startup"] = await bench_startup(mock, STARTUP_TRADES, startup_runs)
+    finally:
+        await mock.stop()
+    return results
+
+
+def _print(results: dict):
+    print(f"Mock latency: {results['latency_s'] * 1000:.1f}ms")
+    for key in ("maketrade_rest", "maketrade_stream"):
+        if key not in results:
+            continue
+        r = results[key]
+        print(f"{key:<18} p50={r['p50_ms']:8.2f}ms p95={r['p95_ms']:8.2f}ms "
+              f"requests/decision={r['requests_per_decision']:.2f}")
+    for r in results.get("monitor", []):
+        print(f"monitor {r['open_trades']:>5} trades p50={r['p50_ms']:8.2f}ms p95={r['p95_ms']:8.2f}ms "
+              f"requests/pass={r['requests_per_pass']:.2f}")
+    r = results["startup"]
+    print(f"startup {r['open_trades']:>5} trades p50={r['p50_ms']:8.2f}ms max={r['max_ms']:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the order and monitoring paths against a local mock")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated per-request latency in seconds")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--trades", default="10,100,1000", help="open-trade counts for the monitor benchmark")
+    parser.add_argument("--startup-runs", type=int, default=3, help="restarts timed by the startup benchmark")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET,
+                        help="fail (exit status 1) if the median restart takes longer than this many seconds; "
+                             "0 disables the check")
+    parser.add_argument("--startup-only", action="store_true", help="only run the startup benchmark")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run_benchmarks(args.latency, args.iterations, [int(n) for n in args.trades.split(",")],
+                                         args.startup_runs, args.startup_only))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print(results)
+    startup = results["startup"]["p50_ms"] / 1000
+    if args.startup_budget and startup > args.startup_budget:
+        print(f"Startup took {startup:.2f}s, over the {args.startup_budget:.2f}s budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
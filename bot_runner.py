@@ -1,18 +1,57 @@
 import asyncio
 import logging
-import nest_asyncio
-from telegram_bot import TelegramBot
+import multiprocessing
+import os
+from accounts import AccountRegistry, account_ids_from_env, run_worker, shard
+from scheduler import Scheduler
 
 logging.basicConfig(level=logging.INFO)
 
-async def main():
-    bot = TelegramBot()
+async def main(account_ids=None, per_account=None):
+    accounts = AccountRegistry(account_ids or account_ids_from_env(), per_account=per_account)
+    scheduler = Scheduler()
+    # Entry scans, exit checks, reconciliation and status snapshots run as scheduler jobs;
+    # Telegram handlers only trigger jobs or read their cached results.
+    await accounts.start(scheduler)
+    scheduler.start()
+    # Open trades are guarded from here on; the Telegram layer is imported and connected after
+    from telegram_bot import TelegramBot
+    bot = TelegramBot(accounts)
+    bot.attach_scheduler(scheduler)
     await bot.app.initialize()
     await bot.app.start()
     await bot.app.updater.start_polling()
     # Hold the program open forever until externally stopped (ctrl+c)
-    await asyncio.Event().wait()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await scheduler.stop()
+        await bot.app.updater.stop()
+        await bot.app.stop()
+        await bot.app.shutdown()
+        await accounts.stop()
+
+def start_workers(shards, per_account):
+    """Trade each extra shard of accounts in its own process; Telegram stays in this one."""
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for index, account_ids in enumerate(shards, start=1):
+        worker = context.Process(target=run_worker, args=(account_ids, index, per_account), name=f"accounts-{index}", daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
 
 if __name__ == "__main__":
-    nest_asyncio.apply()
-    asyncio.run(main())
\ No newline at end of file
+    # OANDA_WORKERS > 1 spreads accounts over worker processes once one event loop is not enough
+    account_ids = account_ids_from_env()
+    shards = shard(account_ids, int(os.getenv("OANDA_WORKERS", "1")))
+    # State file naming follows the whole deployment, not the shard each process holds
+    per_account = len(account_ids) > 1
+    workers = start_workers(shards[1:], per_account)
+    try:
+        asyncio.run(main(shards[0], per_account))
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join(10)
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger("candle_store")
+
+COLUMNS = {"t": np.int64, "o": np.float64, "h": np.float64, "l": np.float64, "c": np.float64, "v": np.int64}
+
+GRANULARITY_SECONDS = {
+    "S5": 5, "S10": 10, "S15": 15, "S30": 30, "M1": 60, "M2": 120, "M4": 240, "M5": 300, "M10": 600,
+    "M15": 900, "M30": 1800, "H1": 3600, "H2": 7200, "H3": 10800, "H4": 14400, "H6": 21600, "H8": 28800,
+    "H12": 43200, "D": 86400, "W": 604800,
+}
+
+MAX_CANDLES_PER_REQUEST = 5000
+INDEX_STRIDE = 4096
+REWRITE_DIR = ".rewrite"
+
+
+class CandleStore:
+    """Append-only columnar candle files, memory-mapped for zero-copy NumPy reads.
+
+    Each instrument/granularity series is a directory holding one raw little-endian file
+    per column (t, o, h, l, c, v; t is epoch seconds) plus index.json with the row count,
+    time bounds and a sparse time -> row index every INDEX_STRIDE rows.
+
+    A series rebuilt wholesale is staged under REWRITE_DIR and then moved over the live
+    files, index.json last. A move interrupted by a crash is finished on the next load.
+    """
+
+    def __init__(self, root: str = "candles"):
+        self.root = root
+        self._maps: dict[tuple[str, str], dict] = {}
+        self._indexes: dict[tuple[str, str], dict] = {}
+
+    def _dir(self, instrument: str, granularity: str) -> str:
+        return os.path.join(self.root, instrument, granularity)
+
+    def index(self, instrument: str, granularity: str) -> dict:
+        key = (instrument, granularity)
+        if key not in self._indexes:
+            self._finish_rewrite(instrument, granularity)
+            path = os.path.join(self._dir(instrument, granularity), "index.json")
+            if os.path.isfile(path):
+                with open(path, "r") as f:
+                    self._indexes[key] = json.load(f)
+            else:
+                self._indexes[key] = {"count": 0, "first": None, "last": None, "sparse": []}
+        return self._indexes[key]
+
+    def _write_index(self, instrument: str, granularity: str, index: dict):
+        path = os.path.join(self._dir(instrument, granularity), "index.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+        self._indexes[(instrument, granularity)] = index
+
+    def _columns(self, instrument: str, granularity: str) -> Optional[dict]:
+        key = (instrument, granularity)
+        count = self.index(instrument, granularity)["count"]
+        cached = self._maps.get(key)
+        if cached is not None and len(cached["t"]) == count:
+            return cached
+        if count == 0:
+            return None
+        directory = self._dir(instrument, granularity)
+        maps = {
+            name: np.memmap(os.path.join(directory, name), dtype=dtype, mode="r", shape=(count,))
+            for name, dtype in COLUMNS.items()
+        }
+        self._maps[key] = maps
+        return maps
+
+    def append(self, instrument: str, granularity: str, t, o, h, l, c, v) -> int:
+        """Append rows newer than the last stored candle; returns the number written."""
+        data = {name: np.asarray(col, dtype=COLUMNS[name]) for name, col in zip(COLUMNS, (t, o, h, l, c, v))}
+        index = self.index(instrument, granularity)
+        order = np.argsort(data["t"], kind="stable")
+        data = {name: col[order] for name, col in data.items()}
+        keep = np.ones(len(data["t"]), dtype=bool)
+        keep[1:] = data["t"][1:] != data["t"][:-1]
+        if index["last"] is not None:
+            keep &= data["t"] > index["last"]
+        data = {name: col[keep] for name, col in data.items()}
+        rows = len(data["t"])
+        if rows == 0:
+            return 0
+
+        directory = self._dir(instrument, granularity)
+        os.makedirs(directory, exist_ok=True)
+        start = index["count"]
+        for name, col in data.items():
+            path = os.path.join(directory, name)
+            with open(path, "r+b" if os.path.isfile(path) else "wb") as f:
+                # index.json is the commit point: bytes past count are left over from an append
+                # that crashed before the index was rewritten, so write over them
+                offset = start * np.dtype(COLUMNS[name]).itemsize
+                f.truncate(offset)
+                f.seek(offset)
+                f.write(col.astype(COLUMNS[name]).tobytes())
+
+        sparse = list(index["sparse"])
+        for row in range(-(-start // INDEX_STRIDE) * INDEX_STRIDE, start + rows, INDEX_STRIDE):
+            sparse.append([int(data["t"][row - start]), row])
+        self._write_index(instrument, granularity, {
+            "count": start + rows,
+            "first": int(data["t"][0]) if index["first"] is None else index["first"],
+            "last": int(data["t"][-1]),
+            "sparse": sparse,
+        })
+        return rows
+
+    def _rewrite(self, instrument: str, granularity: str, data: dict):
+        staging = os.path.join(self.root, REWRITE_DIR)
+        shutil.rmtree(os.path.join(staging, instrument, granularity), ignore_errors=True)
+        CandleStore(staging).append(instrument, granularity, *(data[name] for name in COLUMNS))
+        self._maps.pop((instrument, granularity), None)
+        self._indexes.pop((instrument, granularity), None)
+        self._finish_rewrite(instrument, granularity)
+
+    def _finish_rewrite(self, instrument: str, granularity: str):
+        """Move a staged rewrite into place; staging without index.json is incomplete and dropped."""
+        staged = os.path.join(self.root, REWRITE_DIR, instrument, granularity)
+        if not os.path.isfile(os.path.join(staged, "index.json")):
+            if os.path.isdir(staged):
+                shutil.rmtree(staged, ignore_errors=True)
+            return
+        directory = self._dir(instrument, granularity)
+        os.makedirs(directory, exist_ok=True)
+        for name in (*COLUMNS, "index.json"):
+            path = os.path.join(staged, name)
+            if os.path.isfile(path):
+                os.replace(path, os.path.join(directory, name))
+        shutil.rmtree(staged, ignore_errors=True)
+
+    def _row_bounds(self, instrument: str, granularity: str, start: Optional[float], end: Optional[float]):
+        index = self.index(instrument, granularity)
+        cols = self._columns(instrument, granularity)
+        if cols is None:
+            return None, 0, 0
+        t = cols["t"]
+        sparse = index["sparse"]
+        lo, hi = 0, index["count"]
+        if start is not None:
+            # Narrow with the sparse index so searchsorted touches only one stride of pages
+            i = np.searchsorted([s[0] for s in sparse], start, side="right") - 1
+            base = sparse[i][1] if i >= 0 else 0
+            lo = base + int(np.searchsorted(t[base:base + INDEX_STRIDE + 1], start, side="left"))
+        if end is not None:
+            i = np.searchsorted([s[0] for s in sparse], end, side="right") - 1
+            base = sparse[i][1] if i >= 0 else 0
+            hi = base + int(np.searchsorted(t[base:base + INDEX_STRIDE + 1], end, side="right"))
+        return cols, lo, max(lo, hi)
+
+    def read(self, instrument: str, granularity: str, start: Optional[float] = None,
+             end: Optional[float] = None) -> dict[str, np.ndarray]:
+        """Columns for candles with start <= t <= end, as read-only memmap slices."""
+        cols, lo, hi = self._row_bounds(instrument, granularity, start, end)
+        if cols is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: col[lo:hi] for name, col in cols.items()}
+
+    def tail(self, instrument: str, granularity: str, rows: int) -> dict[str, np.ndarray]:
+        cols = self._columns(instrument, granularity)
+        if cols is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: col[-rows:] for name, col in cols.items()}
+
+    def atr(self, instrument: str, granularity: str, window: int = 14) -> Optional[float]:
+        """Simple average true range over the last `window` stored candles, in price units."""
+        cols = self.tail(instrument, granularity, window + 1)
+        if len(cols["c"]) < window + 1:
+            return None
+        high, low, prev_close = cols["h"][1:], cols["l"][1:], cols["c"][:-1]
+        true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+        return float(true_range.mean())
+
+    def atr_pips(self, instrument: str, granularity: str, window: int = 14) -> Optional[float]:
+        atr = self.atr(instrument, granularity, window)
+        if atr is None:
+            return None
+        return atr / (0.01 if instrument.endswith("JPY") else 0.0001)
+
+    async def backfill(self, client, instrument: str, granularity: str, start: datetime,
+                       end: Optional[datetime] = None) -> int:
+        """Fetch only the candles missing from [start, end] through client.get_candles."""
+        step = GRANULARITY_SECONDS[granularity]
+        start_ts = int(start.timestamp())
+        end_ts = int((end or datetime.now(timezone.utc)).timestamp())
+        index = self.index(instrument, granularity)
+        written = 0
+
+        if index["first"] is not None and start_ts < index["first"] - step:
+            # History before what we hold: fetch the gap and rebuild the series once
+            older = await self._fetch(client, instrument, granularity, start_ts, index["first"] - 1)
+            if older is not None and len(older["t"]):
+                existing = {name: np.array(col) for name, col in self.read(instrument, granularity).items()}
+                merged = {name: np.concatenate([older[name], existing[name]]) for name in COLUMNS}
+                self._rewrite(instrument, granularity, merged)
+                written += len(older["t"])
+
+        index = self.index(instrument, granularity)
+        cursor = start_ts if index["last"] is None else index["last"] + 1
+        if cursor <= end_ts:
+            newer = await self._fetch(client, instrument, granularity, cursor, end_ts)
+            if newer is not None:
+                written += self.append(instrument, granularity, *(newer[name] for name in COLUMNS))
+        if written:
+            logger.info(f"Backfilled {written} {granularity} candles for {instrument}")
+        return written
+
+    async def _fetch(self, client, instrument: str, granularity: str, start_ts: int, end_ts: int) -> Optional[dict]:
+        chunks = []
+        cursor = start_ts
+        while cursor <= end_ts:
+            candles = await client.get_candles(instrument, granularity, from_time=cursor, count=MAX_CANDLES_PER_REQUEST)
+            if candles is None:
+                return None
+            rows = [c for c in candles if c.get("complete", True) and float(c["time"]) <= end_ts]
+            if rows:
+                chunks.append(rows)
+            if len(candles) < MAX_CANDLES_PER_REQUEST or not rows:
+                break
+            cursor = int(float(rows[-1]["time"])) + 1
+        rows = [c for chunk in chunks for c in chunk]
+        return {
+            "t": np.array([int(float(c["time"])) for c in rows], dtype=np.int64),
+            "o": np.array([float(c["mid"]["o"]) for c in rows]),
+            "h": np.array([float(c["mid"]["h"]) for c in rows]),
+            "l": np.array([float(c["mid"]["l"]) for c in rows]),
+            "c": np.array([float(c["mid"]["c"]) for c in rows]),
+            "v": np.array([int(c.get("volume", 0)) for c in rows], dtype=np.int64),
+        }
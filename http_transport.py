@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+import httpx
+
+from metrics import REQUEST_SECONDS, REQUESTS, RETRIES
+
+logger = logging.getLogger("http_transport")
+
+# OANDA allows 120 requests/second per account on REST; stay a little under it.
+DEFAULT_RATE = 100.0
+DEFAULT_BURST = 20
+
+DEFAULT_TIMEOUTS = {
+    "orders": httpx.Timeout(10.0, connect=3.0),
+    "trade_close": httpx.Timeout(10.0, connect=3.0),
+    "position_close": httpx.Timeout(10.0, connect=3.0),
+    "pricing": httpx.Timeout(3.0, connect=2.0),
+    "summary": httpx.Timeout(5.0, connect=2.0),
+    "open_trades": httpx.Timeout(5.0, connect=2.0),
+    "candles": httpx.Timeout(15.0, connect=3.0),
+    "transactions": httpx.Timeout(10.0, connect=3.0),
+}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Client-side rate limiter: `rate` tokens per second, bursts of up to `burst`."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Transport:
+    """Pooled httpx client with per-endpoint timeouts, rate limiting and retries.
+
+    Only idempotent requests are retried on network errors and 5xx responses; a 429 is
+    retried for any method after its Retry-After, since OANDA rejects it before acting.
+
+    The httpx client is built on first use: creating it loads the TLS trust store, which
+    is slow enough to matter at startup. open() builds it off the event loop instead.
+    """
+
+    def __init__(self, headers: dict, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0, http2: bool = False, timeouts: Optional[dict] = None,
+                 default_timeout: httpx.Timeout = httpx.Timeout(5.0, connect=3.0), max_retries: int = 3,
+                 backoff_base: float = 0.2, backoff_max: float = 5.0, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST):
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.headers = headers
+        self.http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+        self._opening: Optional[asyncio.Future] = None
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(headers=self.headers, limits=self.limits, http2=self.http2,
+                                 timeout=self.default_timeout)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    async def open(self) -> httpx.AsyncClient:
+        """Build the client in a worker thread so the event loop keeps serving meanwhile."""
+        if self._client is None:
+            # Stacks sharing this transport open it concurrently; they all wait on one build
+            if self._opening is None:
+                self._opening = asyncio.ensure_future(asyncio.to_thread(self._build_client))
+            client = await asyncio.shield(self._opening)
+            if self._client is None:
+                self._client = client
+            self._opening = None
+        return self._client
+
+    def stream(self, method: str, url: str, **kwargs):
+        return self.client.stream(method, url, **kwargs)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    async def request(self, method: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        idempotent = method in IDEMPOTENT_METHODS
+        timeout = self.timeouts.get(endpoint, self.default_timeout)
+        latency = REQUEST_SECONDS.labels(endpoint)
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                await self.bucket.acquire()
+            REQUESTS.inc()
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                latency.observe(time.perf_counter() - started)
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{endpoint}: {type(e).__name__} ({e}), retry {attempt + 1} in {delay:.2f}s")
+            else:
+                latency.observe(time.perf_counter() - started)
+                if response.status_code == 429 and attempt < self.max_retries:
+                    delay = self._retry_after(response)
+                    delay = self._backoff(attempt) if delay is None else delay
+                    logger.warning(f"{endpoint}: rate limited, retry {attempt + 1} in {delay:.2f}s")
+                elif response.status_code in RETRYABLE_STATUS and idempotent and attempt < self.max_retries:
+                    delay = self._backoff(attempt)
+                    logger.warning(f"{endpoint}: HTTP {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+                else:
+                    return response
+            attempt += 1
+            RETRIES.inc()
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
@@ -1,9 +1,120 @@
 import random
 
+import numpy as np
+
 CURRENCY_PAIRS = [
     "EUR_USD", "USD_JPY", "GBP_USD", "AUD_USD", "USD_CAD",
     "NZD_USD", "USD_CHF", "EUR_GBP", "EUR_JPY", "GBP_JPY"
 ]
 
+class InstrumentSelector:
+    """Ranks pairs from rolling per-tick indicators kept in fixed-size NumPy buffers.
+
+    Every update is O(1): ATR, the fast/slow EMAs and the spread average are exponentially
+    smoothed in place, and momentum reads the mid `momentum_lag` ticks back from a ring
+    buffer. Scoring is one vectorized pass over all pairs.
+
+    Pairs without min_ticks live ticks fall back to a score computed from stored candles by
+    warm_up(). Those bar statistics are kept apart so they never leak into the per-tick
+    ATR and spread averages.
+    """
+
+    def __init__(self, instruments: list[str] = CURRENCY_PAIRS, window: int = 64, atr_period: int = 14,
+                 fast_period: int = 12, slow_period: int = 26, momentum_lag: int = 10, min_ticks: int = 30,
+                 spread_weight: float = 0.5):
+        self.instruments = list(instruments)
+        self.index = {inst: j for j, inst in enumerate(self.instruments)}
+        n = len(self.instruments)
+        self.window = window
+        self.momentum_lag = min(momentum_lag, window - 1)
+        self.min_ticks = min_ticks
+        self.spread_weight = spread_weight
+        self.atr_alpha = 1.0 / atr_period
+        self.fast_alpha = 2.0 / (fast_period + 1)
+        self.slow_alpha = 2.0 / (slow_period + 1)
+        self.pip = np.array([0.01 if inst.endswith("JPY") else 0.0001 for inst in self.instruments])
+
+        self.mids = np.zeros((n, window))  # ring buffer of mid prices per pair
+        self.pos = np.zeros(n, dtype=np.int64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.last = np.zeros(n)
+        self.atr = np.zeros(n)
+        self.ema_fast = np.zeros(n)
+        self.ema_slow = np.zeros(n)
+        self.spread = np.zeros(n)
+        self.momentum = np.zeros(n)
+        self.bar_scores = np.full(n, -np.inf)  # from warm_up(), used until a pair has min_ticks
+
+    def update(self, instrument: str, bid: float, ask: float):
+        j = self.index.get(instrument)
+        if j is None:
+            return
+        mid = (bid + ask) / 2
+        spread = ask - bid
+        if self.count[j] == 0:
+            self.last[j] = self.ema_fast[j] = self.ema_slow[j] = mid
+            self.spread[j] = spread
+        else:
+            self.atr[j] += (abs(mid - self.last[j]) - self.atr[j]) * self.atr_alpha
+            self.ema_fast[j] += (mid - self.ema_fast[j]) * self.fast_alpha
+            self.ema_slow[j] += (mid - self.ema_slow[j]) * self.slow_alpha
+            self.spread[j] += (spread - self.spread[j]) * self.atr_alpha
+        pos = self.pos[j]
+        if self.count[j] >= self.momentum_lag:
+            self.momentum[j] = mid - self.mids[j, (pos - self.momentum_lag) % self.window]
+        self.mids[j, pos] = mid
+        self.pos[j] = (pos + 1) % self.window
+        self.count[j] += 1
+        self.last[j] = mid
+
+    def _score(self, ema_fast, ema_slow, momentum, atr, spread) -> np.ndarray:
+        noise = np.maximum(atr / self.pip, 0.1)
+        trend = (ema_fast - ema_slow) / self.pip + 0.5 * momentum / self.pip
+        cost = spread / self.pip
+        return (trend - self.spread_weight * cost) / noise
+
+    def scores(self) -> np.ndarray:
+        """Trend strength per unit of volatility, net of spread cost; -inf for pairs with neither enough ticks nor a warm-up score."""
+        scores = self._score(self.ema_fast, self.ema_slow, self.momentum, self.atr, self.spread)
+        return np.where(self.count >= self.min_ticks, scores, self.bar_scores)
+
+    def score(self, instrument: str) -> float:
+        j = self.index.get(instrument)
+        if j is None:
+            return 0.0
+        score = self.scores()[j]
+        return float(score) if np.isfinite(score) else 0.0
+
+    def warm_up(self, candle_store, granularity: str = "M5"):
+        """Score pairs from stored closes so ranking works before live ticks accumulate.
+
+        The same indicators are run over candle closes instead of tick mids, with no spread
+        cost since candles carry none. The result only stands in until a pair has min_ticks.
+        """
+        for instrument, j in self.index.items():
+            closes = candle_store.tail(instrument, granularity, self.window)["c"].astype(float)
+            if len(closes) < self.min_ticks:
+                continue
+            ema_fast = ema_slow = closes[0]
+            atr = 0.0
+            for prev, close in zip(closes[:-1], closes[1:]):
+                atr += (abs(close - prev) - atr) * self.atr_alpha
+                ema_fast += (close - ema_fast) * self.fast_alpha
+                ema_slow += (close - ema_slow) * self.slow_alpha
+            momentum = closes[-1] - closes[-1 - self.momentum_lag]
+            self.bar_scores[j] = self._score(ema_fast, ema_slow, momentum, atr, 0.0)[j]
+
+    def rank(self) -> list[str]:
+        """All pairs, best score first; pairs still warming up keep their listed order at the end."""
+        order = np.argsort(-self.scores(), kind="stable")
+        return [self.instruments[j] for j in order]
+
+    def choose(self) -> str:
+        if not np.isfinite(self.scores()).any():
+            return random.choice(self.instruments)
+        return self.instruments[int(np.argmax(self.scores()))]
+
+default_selector = InstrumentSelector()
+
 def choose_best_instrument():
-    return random.choice(CURRENCY_PAIRS)
\ No newline at end of file
+    return default_selector.choose()
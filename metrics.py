@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from background import BackgroundTask
+
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50)
+
+
+class Histogram:
+    """Fixed-bucket histogram. observe() only bumps preallocated counters, so it is safe on hot paths."""
+
+    __slots__ = ("name", "help", "labels", "bounds", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS, labels: str = ""):
+        self.name = name
+        self.help = help
+        self.labels = labels  # preformatted, e.g. 'endpoint="orders"'
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile; inf if it falls past the last bucket."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def render(self, lines: list[str]):
+        sep = "," if self.labels else ""
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{{self.labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{{self.labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{self.labels}}}" if self.labels else ""
+        lines.append(f"{self.name}_sum{suffix} {self.sum}")
+        lines.append(f"{self.name}_count{suffix} {self.count}")
+
+
+class HistogramFamily:
+    """Histograms sharing a name, one per value of a single label (created on first use)."""
+
+    def __init__(self, name: str, help: str, label: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.children: dict[str, Histogram] = {}
+
+    def labels(self, value: str) -> Histogram:
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = Histogram(self.name, self.help, self.buckets, f'{self.label}="{value}"')
+        return child
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def histogram_family(self, name: str, help: str, label: str, buckets=LATENCY_BUCKETS) -> HistogramFamily:
+        return self.register(HistogramFamily(name, help, label, buckets))
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.register(Gauge(name, help))
+
+    def _histograms(self):
+        for metric in self.metrics:
+            if isinstance(metric, HistogramFamily):
+                yield from metric.children.values()
+            elif isinstance(metric, Histogram):
+                yield metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            kind = {Counter: "counter", Gauge: "gauge"}.get(type(metric), "histogram")
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            if isinstance(metric, HistogramFamily):
+                for child in metric.children.values():
+                    child.render(lines)
+            elif isinstance(metric, Histogram):
+                metric.render(lines)
+            else:
+                lines.append(f"{metric.name} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Short human-readable digest: count, mean, p50 and p95 per non-empty histogram."""
+        def fmt(seconds):
+            if seconds == float("inf"):
+                return "inf"
+            return f"{seconds * 1000:.1f}ms"
+
+        lines = []
+        for h in self._histograms():
+            if not h.count:
+                continue
+            label = f"{h.name}{{{h.labels}}}" if h.labels else h.name
+            if h.bounds is LATENCY_BUCKETS:
+                lines.append(f"{label}: n={h.count} mean={fmt(h.mean())} "
+                             f"p50<={fmt(h.quantile(0.5))} p95<={fmt(h.quantile(0.95))}")
+            else:
+                lines.append(f"{label}: n={h.count} mean={h.mean():.2f} "
+                             f"p50<={h.quantile(0.5)} p95<={h.quantile(0.95)}")
+        for metric in self.metrics:
+            if isinstance(metric, (Counter, Gauge)):
+                lines.append(f"{metric.name}: {metric.value:g}")
+        return "\n".join(lines) if lines else "No metrics recorded yet."
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram_family(
+    "oanda_request_seconds", "OANDA REST round-trip time per attempt", "endpoint")
+REQUESTS = registry.counter("oanda_requests_total", "OANDA REST requests sent, including retries")
+RETRIES = registry.counter("oanda_request_retries_total", "OANDA REST requests retried")
+ORDER_FILL_SECONDS = registry.histogram(
+    "order_to_fill_seconds", "Time from order submission to the fill confirmation, including queueing and retries")
+SIZING_SECONDS = registry.histogram("sizing_seconds", "PositionSizer.calculate_units duration per instrument")
+DECISION_SECONDS = registry.histogram("decision_seconds", "TradingBot.run duration: scan, size and place")
+REQUESTS_PER_DECISION = registry.histogram(
+    "requests_per_decision", "OANDA REST requests sent while a TradingBot.run was in flight", COUNT_BUCKETS)
+DECISIONS = registry.counter("decisions_total", "TradingBot.run calls")
+MONITOR_PASS_SECONDS = registry.histogram("monitor_pass_seconds", "TradeCloser.monitor_trades duration")
+EXIT_TICK_SECONDS = registry.histogram(
+    "exit_tick_seconds", "ExitEngine work per price tick on an instrument with open trades")
+LOOP_LAG_SECONDS = registry.histogram("event_loop_lag_seconds", "Event loop scheduling delay")
+
+
+class LoopLagMonitor(BackgroundTask):
+    """Samples event-loop lag: how late a sleep of `interval` wakes up."""
+
+    task_name = "loop_lag_monitor"
+
+    def __init__(self, histogram: Histogram = LOOP_LAG_SECONDS, interval: float = 0.25):
+        self.histogram = histogram
+        self.interval = interval
+
+    async def _run(self):
+        interval = self.interval
+        observe = self.histogram.observe
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            observe(max(0.0, time.perf_counter() - started - interval))
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving registry.render() at /metrics for Prometheus to scrape."""
+
+    def __init__(self, registry: Registry = registry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,416 @@
+"""Local stand-in for the OANDA v3 REST and streaming endpoints used by OandaClient.
+
+Prices follow a synthetic random walk, and every response can be delayed or
+failed at a configurable rate. Run standalone with:
+
+    python mock_oanda.py --port 8080 --latency 0.05 --error-rate 0.01
+
+then point the bot at it with OANDA_BASE_URL/OANDA_STREAM_URL=http://127.0.0.1:8080/v3.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from candle_store import GRANULARITY_SECONDS
+from instrument_selector import CURRENCY_PAIRS
+
+logger = logging.getLogger("mock_oanda")
+
+START_PRICES = {
+    "EUR_USD": 1.0850, "USD_JPY": 151.20, "GBP_USD": 1.2650, "AUD_USD": 0.6550, "USD_CAD": 1.3600,
+    "NZD_USD": 0.6050, "USD_CHF": 0.8950, "EUR_GBP": 0.8580, "EUR_JPY": 164.10, "GBP_JPY": 191.30,
+}
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+           503: "Service Unavailable"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _pip(instrument: str) -> float:
+    return 0.01 if instrument.endswith("JPY") else 0.0001
+
+
+class MockOanda:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, tick_interval: float = 0.25, volatility: float = 0.0002,
+                 spread_pips: float = 1.0, balance: float = 10_000.0, margin_rate: float = 0.0333,
+                 seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tick_interval = tick_interval
+        self.volatility = volatility
+        self.spread_pips = spread_pips
+        self.balance = balance
+        self.margin_rate = margin_rate
+        self.random = random.Random(seed)
+        self.mids = {inst: START_PRICES.get(inst, 1.0) for inst in CURRENCY_PAIRS}
+        self.trades: dict[str, dict] = {}
+        self.transactions: list[dict] = []
+        self.next_id = 1
+        self.requests = Counter()  # (method, endpoint) -> count
+        self._streams: list[asyncio.Queue] = []
+        self._transaction_streams: list[asyncio.Queue] = []
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._ticker: Optional[asyncio.Task] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v3"
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ticker = asyncio.create_task(self._tick_loop())
+        logger.info(f"Mock OANDA listening on {self.base_url}")
+        return self
+
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+        for queue in self._streams + self._transaction_streams:
+            queue.put_nowait(None)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- market simulation -------------------------------------------------
+
+    def quote(self, instrument: str) -> tuple[float, float]:
+        mid = self.mids[instrument]
+        half = self.spread_pips * _pip(instrument) / 2
+        return mid - half, mid + half
+
+    def price_message(self, instrument: str) -> dict:
+        bid, ask = self.quote(instrument)
+        return {
+            "type": "PRICE", "instrument": instrument, "time": _now(), "tradeable": True,
+            "bids": [{"price": f"{bid:.5f}", "liquidity": 1000000}],
+            "asks": [{"price": f"{ask:.5f}", "liquidity": 1000000}],
+            "closeoutBid": f"{bid:.5f}", "closeoutAsk": f"{ask:.5f}",
+        }
+
+    def step_prices(self):
+        for inst in self.mids:
+            self.mids[inst] *= math.exp(self.random.gauss(0, self.volatility))
+        for queue in self._streams:
+            for inst in self.mids:
+                queue.put_nowait(self.price_message(inst))
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            self.step_prices()
+
+    # --- account simulation ------------------------------------------------
+
+    def _transaction(self, **fields) -> dict:
+        txn = {"id": str(self.next_id), "accountID": "mock", "time": _now(), **fields}
+        self.next_id += 1
+        self.transactions.append(txn)
+        for queue in self._transaction_streams:
+            queue.put_nowait(txn)
+        return txn
+
+    def _unrealized(self, trade: dict) -> float:
+        bid, ask = self.quote(trade["instrument"])
+        units = float(trade["currentUnits"])
+        exit_price = bid if units > 0 else ask
+        return units * (exit_price - float(trade["price"]))
+
+    def open_trade(self, instrument: str, units: int, price: Optional[float] = None) -> tuple[dict, dict]:
+        bid, ask = self.quote(instrument)
+        if price is None:
+            price = ask if units > 0 else bid
+        order = self._transaction(type="MARKET_ORDER", instrument=instrument, units=str(units))
+        trade_id = str(self.next_id)
+        trade = {
+            "id": trade_id, "instrument": instrument, "price": f"{price:.5f}", "openTime": _now(),
+            "initialUnits": str(units), "currentUnits": str(units), "state": "OPEN", "realizedPL": "0.0",
+            "initialMarginRequired": f"{abs(units) * price * self.margin_rate:.4f}",
+        }
+        self.trades[trade_id] = trade
+        fill = self._transaction(type="ORDER_FILL", orderID=order["id"], instrument=instrument, units=str(units),
+                                 price=f"{price:.5f}", reason="MARKET_ORDER", pl="0.0",
+                                 accountBalance=f"{self.balance:.4f}", tradeOpened={"tradeID": trade_id, "units": str(units), "price": f"{price:.5f}"})
+        return order, fill
+
+    def seed_trades(self, count: int, instruments: Optional[list[str]] = None):
+        """Open count trades at the current price, spread across instruments."""
+        instruments = instruments or list(self.mids)
+        for i in range(count):
+            self.open_trade(instruments[i % len(instruments)], 100)
+
+    def close(self, trade_id: str) -> Optional[dict]:
+        trade = self.trades.pop(trade_id, None)
+        if trade is None:
+            return None
+        pl = self._unrealized(trade)
+        self.balance += pl
+        units = -float(trade["currentUnits"])
+        bid, ask = self.quote(trade["instrument"])
+        price = bid if units < 0 else ask
+        order = self._transaction(type="MARKET_ORDER", instrument=trade["instrument"], units=str(int(units)),
+                                  reason="TRADE_CLOSE", tradeClose={"tradeID": trade_id, "units": "ALL"})
+        return self._transaction(type="ORDER_FILL", orderID=order["id"], instrument=trade["instrument"],
+                                 units=str(int(units)), price=f"{price:.5f}", reason="MARKET_ORDER_TRADE_CLOSE",
+                                 pl=f"{pl:.4f}", accountBalance=f"{self.balance:.4f}", tradesClosed=[{"tradeID": trade_id, "units": str(int(units)),
+                                                                "realizedPL": f"{pl:.4f}", "price": f"{price:.5f}"}])
+
+    def summary(self) -> dict:
+        unrealized = sum(self._unrealized(t) for t in self.trades.values())
+        margin_used = sum(float(t["initialMarginRequired"]) for t in self.trades.values())
+        nav = self.balance + unrealized
+        return {
+            "id": "mock", "currency": "USD", "balance": f"{self.balance:.4f}", "NAV": f"{nav:.4f}",
+            "unrealizedPL": f"{unrealized:.4f}", "marginUsed": f"{margin_used:.4f}",
+            "marginAvailable": f"{max(0.0, nav - margin_used):.4f}", "openTradeCount": len(self.trades),
+            "lastTransactionID": str(self.next_id - 1),
+        }
+
+    def open_trades(self) -> list[dict]:
+        trades = []
+        for trade in reversed(list(self.trades.values())):
+            trades.append({**trade, "unrealizedPL": f"{self._unrealized(trade):.4f}"})
+        return trades
+
+    # --- HTTP ------------------------------------------------------------------
+
+    ROUTES = [
+        ("POST", re.compile(r"^/v3/accounts/[^/]+/orders$"), "orders"),
+        ("PUT", re.compile(r"^/v3/accounts/[^/]+/trades/([^/]+)/close$"), "trade_close"),
+        ("PUT", re.compile(r"^/v3/accounts/[^/]+/positions/([^/]+)/close$"), "position_close"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/pricing/stream$"), "pricing_stream"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/transactions/stream$"), "transactions_stream"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/transactions/sinceid$"), "transactions_since"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/pricing$"), "pricing"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/summary$"), "summary"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/openTrades$"), "open_trades"),
+        ("GET", re.compile(r"^/v3/instruments/([^/]+)/candles$"), "candles"),
+    ]
+
+    def _route(self, method: str, path: str):
+        for route_method, pattern, name in self.ROUTES:
+            if route_method == method:
+                match = pattern.match(path)
+                if match:
+                    return name, match.groups()
+        return None, ()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode().split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                parts = urlsplit(target)
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                name, args = self._route(method, parts.path)
+                self.requests[(method, name or parts.path)] += 1
+
+                if name == "pricing_stream":
+                    await self._stream_prices(writer, query)
+                    break
+                if name == "transactions_stream":
+                    await self._stream_transactions(writer)
+                    break
+                if self.latency or self.jitter:
+                    await asyncio.sleep(max(0.0, self.random.gauss(self.latency, self.jitter)))
+                if name is None:
+                    status, payload = 404, {"errorMessage": f"No route for {method} {parts.path}"}
+                elif self.error_rate and self.random.random() < self.error_rate:
+                    status, payload = 503, {"errorMessage": "Service unavailable (injected)"}
+                else:
+                    status, payload = getattr(self, f"_{name}")(query, body, *args)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream_prices(self, writer: asyncio.StreamWriter, query: dict):
+        instruments = set(query.get("instruments", "").split(","))
+        queue: asyncio.Queue = asyncio.Queue()
+        self._streams.append(queue)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        try:
+            for inst in instruments & set(self.mids):
+                queue.put_nowait(self.price_message(inst))
+            while True:
+                try:
+                    msg = await asyncio.wait_for(queue.get(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    msg = {"type": "HEARTBEAT", "time": _now()}
+                if msg is None:
+                    break
+                if msg["type"] == "PRICE" and msg["instrument"] not in instruments:
+                    continue
+                chunk = (json.dumps(msg) + "\n").encode()
+                writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self._streams.remove(queue)
+
+    async def _stream_transactions(self, writer: asyncio.StreamWriter):
+        queue: asyncio.Queue = asyncio.Queue()
+        self._transaction_streams.append(queue)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        try:
+            while True:
+                try:
+                    msg = await asyncio.wait_for(queue.get(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    msg = {"type": "HEARTBEAT", "time": _now(), "lastTransactionID": str(self.next_id - 1)}
+                if msg is None:
+                    break
+                chunk = (json.dumps(msg) + "\n").encode()
+                writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self._transaction_streams.remove(queue)
+
+    def _transactions_since(self, query, body):
+        since = int(query.get("id", 0))
+        return 200, {"transactions": [t for t in self.transactions if int(t["id"]) > since],
+                     "lastTransactionID": str(self.next_id - 1)}
+
+    def _orders(self, query, body):
+        order = body.get("order", {})
+        instrument = order.get("instrument")
+        if instrument not in self.mids:
+            return 400, {"errorMessage": f"Invalid instrument {instrument}"}
+        create, fill = self.open_trade(instrument, int(order["units"]))
+        return 201, {"orderCreateTransaction": create, "orderFillTransaction": fill,
+                     "lastTransactionID": fill["id"]}
+
+    def _trade_close(self, query, body, trade_id):
+        fill = self.close(trade_id)
+        if fill is None:
+            return 404, {"errorCode": "TRADE_DOESNT_EXIST", "errorMessage": "The Trade specified does not exist"}
+        return 200, {"orderFillTransaction": fill, "lastTransactionID": fill["id"]}
+
+    def _position_close(self, query, body, instrument):
+        sides = []
+        if body.get("longUnits") == "ALL":
+            sides.append(("long", lambda units: units > 0))
+        if body.get("shortUnits") == "ALL":
+            sides.append(("short", lambda units: units < 0))
+        if not sides:
+            return 400, {"errorMessage": "longUnits or shortUnits must be specified"}
+        payload = {}
+        for side, matches in sides:
+            ids = [t["id"] for t in self.trades.values()
+                   if t["instrument"] == instrument and matches(float(t["currentUnits"]))]
+            if not ids:
+                return 400, {"errorCode": "CLOSEOUT_POSITION_DOESNT_EXIST",
+                             "errorMessage": f"The {side} position does not exist"}
+            fills = [self.close(trade_id) for trade_id in ids]
+            payload[f"{side}OrderFillTransaction"] = {
+                **fills[-1],
+                "pl": f"{sum(float(f['pl']) for f in fills):.4f}",
+                "tradesClosed": [c for f in fills for c in f["tradesClosed"]],
+            }
+        payload["lastTransactionID"] = str(self.next_id - 1)
+        return 200, payload
+
+    def _candles(self, query, body, instrument):
+        if instrument not in self.mids:
+            return 400, {"errorMessage": f"Invalid instrument {instrument}"}
+        step = GRANULARITY_SECONDS.get(query.get("granularity", "S5"))
+        if step is None:
+            return 400, {"errorMessage": "Invalid granularity"}
+        count = min(int(query.get("count", 500)), 5000)
+        now = datetime.now(timezone.utc).timestamp()
+        if "from" in query:
+            start = float(query["from"])
+        else:
+            start = now - count * step
+        start = math.ceil(start / step) * step
+        candles = []
+        # Times are always UNIX, as OandaClient requests with Accept-Datetime-Format: UNIX.
+        # Deterministic walk per (instrument, slot) so repeated backfills agree with each other
+        for slot in range(int(start), int(now) - step + 1, step)[:count]:
+            rng = random.Random(f"{instrument}:{step}:{slot}")
+            mid = self.mids[instrument] * math.exp(rng.gauss(0, self.volatility * 10))
+            wiggle = mid * self.volatility * 5
+            o, c = mid + rng.uniform(-wiggle, wiggle), mid + rng.uniform(-wiggle, wiggle)
+            h, l = max(o, c) + rng.uniform(0, wiggle), min(o, c) - rng.uniform(0, wiggle)
+            candles.append({"time": f"{slot}.000000000", "volume": rng.randint(1, 500), "complete": True,
+                            "mid": {"o": f"{o:.5f}", "h": f"{h:.5f}", "l": f"{l:.5f}", "c": f"{c:.5f}"}})
+        return 200, {"instrument": instrument, "granularity": query.get("granularity"), "candles": candles}
+
+    def _pricing(self, query, body):
+        instruments = [i for i in query.get("instruments", "").split(",") if i in self.mids]
+        return 200, {"prices": [self.price_message(i) for i in instruments], "time": _now()}
+
+    def _summary(self, query, body):
+        return 200, {"account": self.summary(), "lastTransactionID": str(self.next_id - 1)}
+
+    def _open_trades(self, query, body):
+        return 200, {"trades": self.open_trades(), "lastTransactionID": str(self.next_id - 1)}
+
+
+async def _serve(args):
+    server = MockOanda(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                       tick_interval=args.tick_interval, volatility=args.volatility, seed=args.seed)
+    await server.start()
+    print(f"Mock OANDA on {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OANDA v3 stand-in")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="std dev of response delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--tick-interval", type=float, default=0.25)
+    parser.add_argument("--volatility", type=float, default=0.0002, help="per-tick log-return std dev")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,91 @@
+import asyncio
 import logging
-import os
-import httpx
+import time
 from typing import Optional
 
+from http_transport import Transport
+from metrics import ORDER_FILL_SECONDS
+from price_feed import PriceFeed
+
 logger = logging.getLogger("oanda_client")
-logger.info(f"[INIT] OandaClient loaded from: {__file__} | PID: {os.getpid()}")
+
+DEFAULT_BASE_URL = "https://api-fxpractice.oanda.com/v3"
+DEFAULT_STREAM_URL = "https://stream-fxpractice.oanda.com/v3"
+
+class AccountSnapshot:
+    """Caches /summary for a short TTL and merges concurrent fetches onto one request."""
+
+    def __init__(self, fetch, ttl: float = 2.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.account: Optional[dict] = None
+        self.fetched_at = 0.0
+        self.generation = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    def invalidate(self):
+        self.account = None
+        self.generation += 1
+        # Callers arriving after a trade must not join a fetch that started before it
+        self._inflight = None
+
+    async def get(self) -> Optional[dict]:
+        if self.account is not None and time.monotonic() - self.fetched_at < self.ttl:
+            return self.account
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # shield so one cancelled caller does not cancel the fetch for everyone else
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self) -> Optional[dict]:
+        generation = self.generation
+        try:
+            account = await self.fetch()
+            # Drop the result if a trade invalidated the cache while we were fetching
+            if account is not None and generation == self.generation:
+                self.account = account
+                self.fetched_at = time.monotonic()
+            return account
+        finally:
+            if self._inflight is asyncio.current_task():
+                self._inflight = None
 
 class OandaClient:
-    def __init__(self, api_key: str, account_id: str):
+    def __init__(self, api_key: str, account_id: str, base_url: str = DEFAULT_BASE_URL,
+                 stream_url: str = DEFAULT_STREAM_URL, summary_ttl: float = 2.0,
+                 transport: Optional[Transport] = None, transport_options: Optional[dict] = None,
+                 price_feed: Optional[PriceFeed] = None):
         self.api_key = api_key
         self.account_id = account_id
-        self.base_url = "https://api-fxpractice.oanda.com/v3"
+        self.base_url = base_url
+        self.stream_url = stream_url
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        self.client = httpx.AsyncClient(headers=self.headers)
+        # Pass a transport to share one connection pool and rate limit between clients
+        self.owns_transport = transport is None
+        self.transport = transport or Transport(self.headers, **(transport_options or {}))
+        # Also used as a short-lived quote cache for REST prices until the stream is started.
+        # Clients of accounts under the same login can share one feed, and so one price table.
+        self.owns_price_feed = price_feed is None
+        self.price_feed = price_feed or PriceFeed(self.transport, self.stream_url, self.account_id, [])
+        self.snapshot = AccountSnapshot(self._fetch_summary, ttl=summary_ttl)
+
+    @property
+    def client(self):
+        return self.transport.client
+
+    def start_price_feed(self, instruments: list[str]) -> PriceFeed:
+        self.price_feed.instruments = list(dict.fromkeys(self.price_feed.instruments + list(instruments)))
+        self.price_feed.start()
+        return self.price_feed
+
+    async def close(self):
+        if self.owns_price_feed:
+            await self.price_feed.stop()
+        if self.owns_transport:
+            await self.transport.aclose()
 
     async def create_trade(self, instrument: str, units: int) -> tuple[bool, dict | str]:
         url = f"{self.base_url}/accounts/{self.account_id}/orders"
@@ -28,65 +98,223 @@ class OandaClient:
                 "positionFill": "DEFAULT"
             }
         }
+        started = time.perf_counter()
         try:
-            response = await self.client.post(url, json=order_data)
+            response = await self.transport.request("POST", url, "orders", json=order_data)
+            self.snapshot.invalidate()
             if response.status_code == 201:
-                return True, response.json()
+                body = response.json()
+                if "orderFillTransaction" in body:
+                    ORDER_FILL_SECONDS.observe(time.perf_counter() - started)
+                return True, body
+            logger.warning(f"Order for {instrument} rejected: HTTP {response.status_code}")
             return False, response.json()
         except Exception as e:
+            logger.error(f"Exception creating trade for {instrument}: {e}")
             return False, str(e)
 
     async def close_trade(self, trade_id: str) -> tuple[bool, dict | str]:
         url = f"{self.base_url}/accounts/{self.account_id}/trades/{trade_id}/close"
         try:
-            response = await self.client.put(url)
+            response = await self.transport.request("PUT", url, "trade_close")
+            self.snapshot.invalidate()
+            if response.status_code == 200:
+                return True, response.json()
+            logger.warning(f"Close of trade {trade_id} rejected: HTTP {response.status_code}")
+            return False, response.json()
+        except Exception as e:
+            logger.error(f"Exception closing trade {trade_id}: {e}")
+            return False, str(e)
+
+    async def close_position(self, instrument: str, long: bool = True, short: bool = True) -> tuple[bool, dict | str]:
+        """Flatten every trade on an instrument with one request."""
+        url = f"{self.base_url}/accounts/{self.account_id}/positions/{instrument}/close"
+        body = {}
+        if long:
+            body["longUnits"] = "ALL"
+        if short:
+            body["shortUnits"] = "ALL"
+        try:
+            response = await self.transport.request("PUT", url, "position_close", json=body)
+            self.snapshot.invalidate()
             if response.status_code == 200:
                 return True, response.json()
+            logger.warning(f"Close of {instrument} position rejected: HTTP {response.status_code}")
             return False, response.json()
         except Exception as e:
+            logger.error(f"Exception closing {instrument} position: {e}")
             return False, str(e)
 
+    async def create_trades(self, orders: list[tuple[str, int]], max_concurrency: int = 8) -> list[tuple[bool, dict | str]]:
+        """Submit (instrument, units) market orders concurrently; results are in input order."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def submit(instrument, units):
+            async with semaphore:
+                return await self.create_trade(instrument, units)
+
+        return list(await asyncio.gather(*(submit(i, u) for i, u in orders)))
+
+    async def close_trades(self, trade_ids: list[str], open_trades: Optional[list[dict]] = None,
+                           max_concurrency: int = 8) -> list[tuple[bool, dict | str]]:
+        """Close trades concurrently; results are in input order.
+
+        When every open trade on an instrument is in trade_ids, the whole position is
+        flattened with a single positions/close request instead. open_trades must be a
+        complete /openTrades listing, since any trade missing from it would be flattened
+        too; it is fetched when not given and closing several.
+        """
+        if not trade_ids:
+            return []
+        if open_trades is None and len(trade_ids) > 1:
+            open_trades = await self.get_open_trades()
+        by_instrument = {}
+        for trade in open_trades or []:
+            by_instrument.setdefault(trade["instrument"], []).append(trade)
+
+        wanted = set(trade_ids)
+        flatten = {}  # instrument -> trades closed by the position request
+        for instrument, trades in by_instrument.items():
+            if len(trades) > 1 and all(t["id"] in wanted for t in trades):
+                flatten[instrument] = trades
+        flattened = {t["id"]: instrument for instrument, trades in flatten.items() for t in trades}
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def close_one(trade_id):
+            async with semaphore:
+                return await self.close_trade(trade_id)
+
+        async def close_all(instrument, trades):
+            async with semaphore:
+                return await self.close_position(
+                    instrument,
+                    long=any(not t["currentUnits"].startswith("-") for t in trades),
+                    short=any(t["currentUnits"].startswith("-") for t in trades),
+                )
+
+        singles = [trade_id for trade_id in dict.fromkeys(trade_ids) if trade_id not in flattened]
+        results = await asyncio.gather(
+            *(close_all(instrument, trades) for instrument, trades in flatten.items()),
+            *(close_one(trade_id) for trade_id in singles),
+        )
+        by_key = dict(zip(list(flatten) + singles, results))
+        return [by_key[flattened.get(trade_id, trade_id)] for trade_id in trade_ids]
+
     async def get_price(self, instrument: str) -> Optional[float]:
+        price = self.price_feed.get_price(instrument)
+        if price is not None:
+            return price
         url = f"{self.base_url}/accounts/{self.account_id}/pricing"
         params = {"instruments": instrument}
         try:
-            response = await self.client.get(url, params=params)
-            if response.status_code == 200:
+            response = await self.transport.request("GET", url, "pricing", params=params)
+            if response.status_code != 200:
+                logger.warning(f"Pricing request failed: HTTP {response.status_code}")
+            else:
                 prices = response.json().get("prices")
                 if prices:
                     bid = float(prices[0]["bids"][0]["price"])
                     ask = float(prices[0]["asks"][0]["price"])
+                    self.price_feed.update(instrument, bid, ask)
                     return (bid + ask) / 2
         except Exception as e:
             logger.error(f"Exception getting price: {e}")
         return None
 
-    async def get_account_balance(self) -> Optional[float]:
-        url = f"{self.base_url}/accounts/{self.account_id}/summary"
+    async def get_prices(self, instruments: list[str]) -> dict[str, float]:
+        """Mid prices for several instruments, using one /pricing request for any the feed cannot serve."""
+        result = {}
+        missing = []
+        for instrument in dict.fromkeys(instruments):
+            price = self.price_feed.get_price(instrument)
+            if price is None:
+                missing.append(instrument)
+            else:
+                result[instrument] = price
+        if not missing:
+            return result
+        url = f"{self.base_url}/accounts/{self.account_id}/pricing"
+        params = {"instruments": ",".join(missing)}
         try:
-            response = await self.client.get(url)
+            response = await self.transport.request("GET", url, "pricing", params=params)
+            if response.status_code != 200:
+                logger.warning(f"Pricing request failed: HTTP {response.status_code}")
+            else:
+                for p in response.json().get("prices", []):
+                    bid = float(p["bids"][0]["price"])
+                    ask = float(p["asks"][0]["price"])
+                    self.price_feed.update(p["instrument"], bid, ask)
+                    result[p["instrument"]] = (bid + ask) / 2
+        except Exception as e:
+            logger.error(f"Exception getting prices: {e}")
+        return result
+
+    async def get_candles(self, instrument: str, granularity: str, from_time: Optional[float] = None,
+                          count: int = 500) -> Optional[list[dict]]:
+        """Mid candles with UNIX timestamps, oldest first; None on failure."""
+        url = f"{self.base_url}/instruments/{instrument}/candles"
+        params = {"granularity": granularity, "price": "M", "count": count}
+        if from_time is not None:
+            params["from"] = f"{from_time:.0f}"
+        try:
+            response = await self.transport.request(
+                "GET", url, "candles", params=params, headers={"Accept-Datetime-Format": "UNIX"}
+            )
             if response.status_code == 200:
-                return float(response.json()["account"]["balance"])
+                return response.json().get("candles", [])
+            logger.warning(f"Candles request for {instrument} failed: HTTP {response.status_code}")
         except Exception as e:
-            logger.error(f"Exception fetching balance: {e}")
+            logger.error(f"Exception fetching candles for {instrument}: {e}")
         return None
 
-    async def get_margin_available(self) -> Optional[float]:
+    async def get_transactions_since(self, transaction_id: str) -> Optional[tuple[list[dict], str]]:
+        """Transactions after transaction_id and the account's lastTransactionID; None on failure."""
+        url = f"{self.base_url}/accounts/{self.account_id}/transactions/sinceid"
+        try:
+            response = await self.transport.request("GET", url, "transactions", params={"id": transaction_id})
+            if response.status_code == 200:
+                data = response.json()
+                return data.get("transactions", []), data.get("lastTransactionID", transaction_id)
+            logger.warning(f"Transactions request failed: HTTP {response.status_code}")
+        except Exception as e:
+            logger.error(f"Exception fetching transactions: {e}")
+        return None
+
+    async def _fetch_summary(self) -> Optional[dict]:
         url = f"{self.base_url}/accounts/{self.account_id}/summary"
         try:
-            response = await self.client.get(url)
+            response = await self.transport.request("GET", url, "summary")
             if response.status_code == 200:
-                return float(response.json()["account"].get("marginAvailable", 0))
+                return response.json()["account"]
+            logger.warning(f"Account summary request failed: HTTP {response.status_code}")
         except Exception as e:
-            logger.error(f"Exception fetching margin: {e}")
+            logger.error(f"Exception fetching account summary: {e}")
         return None
 
-    async def get_open_trades(self) -> list[dict]:
+    async def get_account_summary(self) -> Optional[dict]:
+        return await self.snapshot.get()
+
+    async def get_account_balance(self) -> Optional[float]:
+        account = await self.snapshot.get()
+        return float(account["balance"]) if account is not None else None
+
+    async def get_margin_available(self) -> Optional[float]:
+        account = await self.snapshot.get()
+        return float(account.get("marginAvailable", 0)) if account is not None else None
+
+    async def fetch_open_trades(self) -> Optional[list[dict]]:
+        """Open trades, or None when the request failed (unlike get_open_trades, which returns [])."""
         url = f"{self.base_url}/accounts/{self.account_id}/openTrades"
         try:
-            response = await self.client.get(url)
+            response = await self.transport.request("GET", url, "open_trades")
             if response.status_code == 200:
                 return response.json().get("trades", [])
+            logger.warning(f"Open trades request failed: HTTP {response.status_code}")
         except Exception as e:
             logger.error(f"Exception fetching trades: {e}")
-        return []
\ No newline at end of file
+        return None
+
+    async def get_open_trades(self) -> list[dict]:
+        trades = await self.fetch_open_trades()
+        return trades if trades is not None else []
\ No newline at end of file
@@ -1,57 +1,145 @@
 import asyncio
-import json
-import os
 import logging
 from collections import defaultdict
 from datetime import datetime, timedelta
 
 from oanda_client import OandaClient
+from state_store import StateStore
 
 logger = logging.getLogger("position_sizer")
 
 STATE_FILE = "trade_state.json"
+SHARPE_WINDOW = 30  # closed trades per instrument kept for the rolling Sharpe ratio
+
+def _default_performance():
+    return {"wins": 0, "losses": 0, "confidence": 0.7, "realized_pl": 0.0, "returns": [], "sharpe": 0.0}
+
+def _rolling_sharpe(returns: list[float]) -> float:
+    if len(returns) < 2:
+        return 0.0
+    mean = sum(returns) / len(returns)
+    var = sum((r - mean) ** 2 for r in returns) / (len(returns) - 1)
+    return mean / var ** 0.5 if var > 0 else 0.0
 
 class PositionSizer:
-    def __init__(self, oanda_client: OandaClient, min_risk=0.01, max_risk=0.03, max_open_trades=100):
+    def __init__(self, oanda_client: OandaClient, min_risk=0.01, max_risk=0.03, max_open_trades=100,
+                 state_file: str | None = STATE_FILE, flush_interval=1.0, defer_load: bool = False):
         self.oanda_client = oanda_client
         self.min_risk = min_risk  # 1%
         self.max_risk = max_risk  # 3%
         self.max_open_trades = max_open_trades
         self.trade_cooldown_minutes = 0.1
+        self.clock = datetime.utcnow  # naive UTC "now"; backtests substitute simulated time
         self.min_confidence = 0.5
         self.trade_state = {
             "last_trade_time": {},
             "open_trades": 0,
-            "performance": defaultdict(lambda: {"wins": 0, "losses": 0, "confidence": 0.7}),
+            "performance": defaultdict(_default_performance),
+            "last_transaction_id": None,  # checkpoint for the transaction ingester
         }
-        self._load_state()
+        self.selector = None  # optional InstrumentSelector providing per-pair scores
+        self.candle_store = None  # optional CandleStore for volatility-aware stops
+        self.atr_granularity = "M5"
+        self.atr_window = 14
+        self.trade_book = None  # optional reconciler.TradeBook; replaces the open_trades counter once synced
+        self.max_trades_per_instrument = None
+        self.risk_engine = None  # optional RiskEngine for portfolio-level currency, VaR and margin limits
+        # state_file=None keeps state in memory only (backtests, benchmarks)
+        self.state_store = StateStore(state_file, flush_interval=flush_interval) if state_file else None
+        self.restored = False
+        if not defer_load:
+            self._load_state()
 
     def _load_state(self):
-        if os.path.isfile(STATE_FILE):
-            try:
-                with open(STATE_FILE, "r") as f:
-                    data = json.load(f)
-                    self.trade_state.update(data)
-                    for inst, t_str in self.trade_state["last_trade_time"].items():
-                        self.trade_state["last_trade_time"][inst] = datetime.fromisoformat(t_str)
-                logger.info("Trade state loaded")
-            except Exception as e:
-                logger.warning(f"Failed to load trade state: {e}")
+        if self.state_store is None or self.restored:
+            return
+        try:
+            self._restore(*self.state_store.load())
+        except Exception as e:
+            logger.warning(f"Failed to load trade state: {e}")
+            # Carry on from empty state rather than retrying on every commit
+            self.restored = True
 
-    def _save_state(self):
+    async def restore(self):
+        """Load persisted state off the event loop; for stacks built with defer_load=True."""
+        if self.restored or self.state_store is None:
+            return
         try:
-            data = self.trade_state.copy()
-            data["last_trade_time"] = {
-                k: v.isoformat() if isinstance(v, datetime) else v
-                for k, v in self.trade_state["last_trade_time"].items()
-            }
-            with open(STATE_FILE, "w") as f:
-                json.dump(data, f)
-            logger.debug("Trade state saved")
+            loaded = await asyncio.to_thread(self.state_store.load)
+            # A commit may have loaded synchronously in the meantime; replaying twice would double count
+            if not self.restored:
+                self._restore(*loaded)
         except Exception as e:
-            logger.warning(f"Failed to save trade state: {e}")
+            logger.warning(f"Failed to load trade state: {e}")
+
+    def _restore(self, data, entries):
+        self.restored = True
+        if data is not None:
+            performance = data.pop("performance", {})
+            self.trade_state.update(data)
+            self.trade_state["performance"] = defaultdict(_default_performance, performance)
+            for inst, t_str in self.trade_state["last_trade_time"].items():
+                self.trade_state["last_trade_time"][inst] = datetime.fromisoformat(t_str)
+        for entry in entries:
+            self._apply(entry)
+        if entries:
+            # Fold the replayed journal into the snapshot so the next start only reads one file
+            self._save_state()
+        logger.info(f"Trade state loaded ({len(entries)} journal entries replayed)")
+
+    def _serialize_state(self):
+        data = self.trade_state.copy()
+        data["last_trade_time"] = {
+            k: v.isoformat() if isinstance(v, datetime) else v
+            for k, v in self.trade_state["last_trade_time"].items()
+        }
+        # Copy nested dicts: the snapshot is written from a worker thread. Untouched
+        # defaults (created by lookups) are left out and rebuilt by the defaultdict on load.
+        default = _default_performance()
+        data["performance"] = {
+            k: {**v, "returns": list(v.get("returns", []))}
+            for k, v in self.trade_state["performance"].items() if v != default
+        }
+        return data
 
-    def update_performance(self, instrument: str, won: bool):
+    def _save_state(self):
+        if self.state_store is not None:
+            self.state_store.mark_dirty(self._serialize_state)
+
+    def _commit(self, entry: dict):
+        if not self.restored:
+            # Deferred load not done yet: load now, or the first flush would overwrite the file
+            self._load_state()
+        self._apply(entry)
+        if self.state_store is not None:
+            self.state_store.append(entry)
+        self._save_state()
+
+    def _apply(self, entry: dict):
+        op = entry["op"]
+        instrument = entry.get("instrument")
+        if op == "record_trade":
+            self.trade_state["last_trade_time"][instrument] = datetime.fromisoformat(entry["time"])
+            self.trade_state["open_trades"] += 1
+        elif op == "record_trades":
+            for inst in entry["instruments"]:
+                self.trade_state["last_trade_time"][inst] = datetime.fromisoformat(entry["time"])
+            self.trade_state["open_trades"] += len(entry["instruments"])
+        elif op == "close_trade":
+            self.trade_state["open_trades"] = max(0, self.trade_state["open_trades"] - 1)
+        elif op == "sync_open_trades":
+            self.trade_state["open_trades"] = entry["count"]
+        elif op == "close_trades":
+            self.trade_state["open_trades"] = max(0, self.trade_state["open_trades"] - len(entry["instruments"]))
+        elif op == "update_performance":
+            self._update_performance(instrument, entry["won"], entry.get("pnl"))
+        elif op == "record_closes":
+            for pnl in entry["pnls"]:
+                self._update_performance(instrument, pnl > 0, pnl)
+        if entry.get("transaction_id") is not None:
+            self._advance_checkpoint(entry["transaction_id"])
+
+    def _update_performance(self, instrument: str, won: bool, pnl: float | None):
         perf = self.trade_state["performance"][instrument]
         if won:
             perf["wins"] += 1
@@ -59,29 +147,96 @@ class PositionSizer:
         else:
             perf["losses"] += 1
             perf["confidence"] = max(0.1, perf["confidence"] - 0.1)
-        self._save_state()
+        if pnl is not None:
+            perf["realized_pl"] = perf.get("realized_pl", 0.0) + pnl
+            returns = perf.setdefault("returns", [])
+            returns.append(pnl)
+            del returns[:-SHARPE_WINDOW]
+            perf["sharpe"] = _rolling_sharpe(returns)
+
+    def _advance_checkpoint(self, transaction_id: str):
+        last = self.trade_state.get("last_transaction_id")
+        if last is None or int(transaction_id) > int(last):
+            self.trade_state["last_transaction_id"] = str(transaction_id)
+
+    async def close(self):
+        if self.state_store is not None:
+            await self.state_store.close()
+
+    def update_performance(self, instrument: str, won: bool, pnl: float | None = None,
+                           transaction_id: str | None = None):
+        # Carrying the transaction id in the same entry keeps counts and checkpoint consistent on replay
+        self._commit({"op": "update_performance", "instrument": instrument, "won": won, "pnl": pnl,
+                      "transaction_id": transaction_id})
+
+    def record_closes(self, instrument: str, pnls: list[float], transaction_id: str):
+        """Every trade closed by one fill, as one journal entry: a crash cannot leave some of them
+        applied with the checkpoint already past the transaction."""
+        if pnls:
+            self._commit({"op": "record_closes", "instrument": instrument, "pnls": list(pnls),
+                          "transaction_id": transaction_id})
+
+    def set_transaction_checkpoint(self, transaction_id: str):
+        last = self.trade_state.get("last_transaction_id")
+        if last is None or int(transaction_id) > int(last):
+            self._commit({"op": "checkpoint", "transaction_id": transaction_id})
+
+    def get_transaction_checkpoint(self):
+        return self.trade_state.get("last_transaction_id")
 
     def get_confidence(self, instrument: str):
         return self.trade_state["performance"].get(instrument, {}).get("confidence", 0.5)
 
+    def get_score(self, instrument: str):
+        return self.selector.score(instrument) if self.selector is not None else 0.0
+
+    def get_atr_pips(self, instrument: str):
+        if self.candle_store is None:
+            return None
+        return self.candle_store.atr_pips(instrument, self.atr_granularity, self.atr_window)
+
+    def get_risk(self, instrument: str):
+        confidence = self.get_confidence(instrument)
+        raw_risk = self.min_risk + (self.max_risk - self.min_risk) * confidence
+        return min(max(raw_risk, self.min_risk), self.max_risk)
+
     def can_trade(self, instrument: str):
         last_time = self.trade_state["last_trade_time"].get(instrument)
-        if last_time and datetime.utcnow() - last_time < timedelta(minutes=self.trade_cooldown_minutes):
+        if last_time and self.clock() - last_time < timedelta(minutes=self.trade_cooldown_minutes):
             logger.info(f"Cooldown active for {instrument}, skipping trade")
             return False
-        if self.trade_state["open_trades"] >= self.max_open_trades:
+        if self.open_trade_count() >= self.max_open_trades:
             logger.info(f"Max open trades reached ({self.max_open_trades}), skipping trade")
             return False
+        if (self.max_trades_per_instrument is not None and self.trade_book is not None
+                and self.trade_book.count(instrument) >= self.max_trades_per_instrument):
+            logger.info(f"Max open trades on {instrument} reached ({self.max_trades_per_instrument}), skipping trade")
+            return False
         return True
 
+    def open_trade_count(self):
+        if self.trade_book is not None and self.trade_book.synced:
+            return len(self.trade_book)
+        return self.trade_state["open_trades"]
+
+    def sync_open_trades(self, count: int):
+        """Overwrite the persisted open-trade counter with the broker-reconciled count."""
+        if self.trade_state["open_trades"] != count:
+            self._commit({"op": "sync_open_trades", "count": count})
+
     def record_trade(self, instrument: str):
-        self.trade_state["last_trade_time"][instrument] = datetime.utcnow()
-        self.trade_state["open_trades"] += 1
-        self._save_state()
+        self._commit({"op": "record_trade", "instrument": instrument, "time": self.clock().isoformat()})
+
+    def record_trades(self, instruments: list[str]):
+        if instruments:
+            self._commit({"op": "record_trades", "instruments": list(instruments), "time": self.clock().isoformat()})
 
     def close_trade(self, instrument: str):
-        self.trade_state["open_trades"] = max(0, self.trade_state["open_trades"] - 1)
-        self._save_state()
+        self._commit({"op": "close_trade", "instrument": instrument})
+
+    def close_trades(self, instruments: list[str]):
+        if instruments:
+            self._commit({"op": "close_trades", "instruments": list(instruments)})
 
     async def calculate_units(self, instrument: str, stop_loss_pips: float):
         balance = await self.oanda_client.get_account_balance()
@@ -97,11 +252,13 @@ class PositionSizer:
             logger.info(f"Confidence {confidence:.2f} below threshold {self.min_confidence}, skipping trade")
             return 0
 
-        raw_risk = self.min_risk + (self.max_risk - self.min_risk) * confidence
-        adjusted_risk = min(max(raw_risk, self.min_risk), self.max_risk)
+        adjusted_risk = self.get_risk(instrument)
 
         volatility_adjustment = 1.5 if confidence < 0.6 else 1.0
-        adjusted_stop_loss = stop_loss_pips * volatility_adjustment
+        # Never place the stop inside normal noise when we have recent history
+        atr_pips = self.get_atr_pips(instrument)
+        base_stop_loss = max(stop_loss_pips, atr_pips) if atr_pips else stop_loss_pips
+        adjusted_stop_loss = base_stop_loss * volatility_adjustment
 
         if instrument.endswith("JPY"):
             pip_value = 0.01
@@ -125,6 +282,10 @@ class PositionSizer:
 
         units = min(units_by_risk, max_units_margin)
 
+        if self.risk_engine is not None and units > 0:
+            # The summary is the same cached snapshot the balance and margin came from
+            units, _ = self.risk_engine.check(instrument, units, await self.oanda_client.get_account_summary())
+
         if units < 1:
             logger.warning(f"Units calculated less than 1 ({units}), no trade placed")
             return 0
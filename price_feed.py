@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from background import Backoff, BackgroundTask
+from http_transport import Transport
+
+logger = logging.getLogger("price_feed")
+
+
+class PriceFeed(BackgroundTask):
+    """Keeps the latest bid/ask per instrument from OANDA's chunked pricing stream.
+
+    The stream only sends an instrument when its price changes, so a quote stays current
+    for as long as the stream itself is alive (any message, heartbeats included, within
+    heartbeat_timeout). Quotes arriving by other routes, such as REST updates while the
+    stream is down, are current for max_age seconds.
+    """
+
+    task_name = "price_feed"
+
+    def __init__(self, client: Optional[Transport | httpx.AsyncClient], stream_url: str, account_id: str,
+                 instruments: list[str], max_age: float = 5.0, heartbeat_timeout: float = 20.0,
+                 min_backoff: float = 0.5, max_backoff: float = 30.0):
+        self.client = client  # None for a feed that is never started and only fed through update()
+        self.url = f"{stream_url}/accounts/{account_id}/pricing/stream"
+        self.instruments = list(instruments)
+        self.max_age = max_age  # seconds before a quote is treated as stale
+        self.heartbeat_timeout = heartbeat_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        # instrument -> [bid, ask, monotonic receive time]
+        self.prices: dict[str, list[float]] = {}
+        self.last_message = 0.0
+        self.reconnects = 0
+        self.listeners = []
+
+    def _stream_alive(self, now: float) -> bool:
+        return self.running and now - self.last_message <= self.heartbeat_timeout
+
+    def get_quote(self, instrument: str) -> Optional[tuple[float, float]]:
+        """Latest (bid, ask), or None when missing or stale."""
+        quote = self.prices.get(instrument)
+        if quote is None:
+            return None
+        now = time.monotonic()
+        if now - quote[2] > self.max_age and not (instrument in self.instruments and self._stream_alive(now)):
+            return None
+        return quote[0], quote[1]
+
+    def get_price(self, instrument: str) -> Optional[float]:
+        quote = self.get_quote(instrument)
+        return None if quote is None else (quote[0] + quote[1]) / 2
+
+    def age(self, instrument: str) -> Optional[float]:
+        quote = self.prices.get(instrument)
+        return None if quote is None else time.monotonic() - quote[2]
+
+    def subscribe(self, callback):
+        """Register callback(instrument, bid, ask), called synchronously on every tick."""
+        if callback not in self.listeners:
+            self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def update(self, instrument: str, bid: float, ask: float):
+        quote = self.prices.get(instrument)
+        now = time.monotonic()
+        if quote is None:
+            self.prices[instrument] = [bid, ask, now]
+        else:
+            quote[0] = bid
+            quote[1] = ask
+            quote[2] = now
+        for callback in self.listeners:
+            try:
+                callback(instrument, bid, ask)
+            except Exception as e:
+                logger.error(f"Price listener failed: {e}")
+
+    def _handle_line(self, line: str):
+        msg = json.loads(line)
+        self.last_message = time.monotonic()
+        if msg.get("type") != "PRICE":
+            return
+        bids = msg.get("bids")
+        asks = msg.get("asks")
+        if not bids or not asks:
+            return
+        self.update(msg["instrument"], float(bids[0]["price"]), float(asks[0]["price"]))
+
+    async def _consume(self):
+        params = {"instruments": ",".join(self.instruments)}
+        timeout = httpx.Timeout(10.0, read=self.heartbeat_timeout)
+        async with self.client.stream("GET", self.url, params=params, timeout=timeout) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise RuntimeError(f"stream returned {response.status_code}: {body[:200]!r}")
+            logger.info(f"Price stream connected for {len(self.instruments)} instruments")
+            async for line in response.aiter_lines():
+                if line:
+                    self._handle_line(line)
+
+    async def _run(self):
+        backoff = Backoff(self.min_backoff, self.max_backoff)
+        while True:
+            backoff.attempt()
+            try:
+                await self._consume()
+                logger.warning("Price stream ended, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Price stream error: {e}")
+            self.reconnects += 1
+            await backoff.sleep()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Optional
+
+from background import BackgroundTask
+
+logger = logging.getLogger("reconciler")
+
+
+class TradeBook:
+    """Authoritative in-memory view of open trades with O(1) per-instrument queries."""
+
+    def __init__(self):
+        self.trades: dict[str, dict] = {}
+        self.by_instrument: dict[str, set] = defaultdict(set)
+        self.net_units: dict[str, float] = defaultdict(float)
+        self.synced = False  # True once a full /openTrades snapshot has been applied
+
+    def __len__(self):
+        return len(self.trades)
+
+    def __contains__(self, trade_id):
+        return trade_id in self.trades
+
+    def add(self, trade: dict) -> bool:
+        trade_id = trade["id"]
+        if trade_id in self.trades:
+            self.remove(trade_id)
+            self._insert(trade)
+            return False
+        self._insert(trade)
+        return True
+
+    def _insert(self, trade: dict):
+        self.trades[trade["id"]] = trade
+        self.by_instrument[trade["instrument"]].add(trade["id"])
+        self.net_units[trade["instrument"]] += float(trade["currentUnits"])
+
+    def remove(self, trade_id: str) -> Optional[dict]:
+        trade = self.trades.pop(trade_id, None)
+        if trade is None:
+            return None
+        instrument = trade["instrument"]
+        self.by_instrument[instrument].discard(trade_id)
+        self.net_units[instrument] -= float(trade["currentUnits"])
+        if not self.by_instrument[instrument]:
+            del self.by_instrument[instrument]
+            del self.net_units[instrument]
+        return trade
+
+    def count(self, instrument: Optional[str] = None) -> int:
+        if instrument is None:
+            return len(self.trades)
+        return len(self.by_instrument.get(instrument, ()))
+
+    def exposure(self, instrument: str) -> float:
+        """Net open units on an instrument (negative when short)."""
+        return self.net_units.get(instrument, 0.0)
+
+    def values(self):
+        return self.trades.values()
+
+
+class TradeReconciler(BackgroundTask):
+    """Keeps a TradeBook in line with the broker.
+
+    Transactions (via TransactionIngester) apply opens, closes and reductions as they
+    happen, including broker-side stop-outs; a periodic /openTrades diff corrects anything
+    missed. Subscribers get callback(added, removed) with lists of trade dicts.
+    """
+
+    task_name = "reconciler"
+
+    def __init__(self, oanda_client, position_sizer=None, interval: float = 30.0):
+        self.oanda = oanda_client
+        self.position_sizer = position_sizer
+        self.interval = interval
+        self.book = TradeBook()
+        self.listeners = []
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, added: list, removed: list):
+        if not added and not removed:
+            return
+        if self.position_sizer is not None:
+            self.position_sizer.sync_open_trades(len(self.book))
+        for callback in self.listeners:
+            try:
+                callback(added, removed)
+            except Exception as e:
+                logger.error(f"Reconciler listener failed: {e}")
+
+    async def reconcile(self) -> bool:
+        open_trades = await self.oanda.fetch_open_trades()
+        if open_trades is None:
+            return False
+        self.apply_snapshot(open_trades)
+        return True
+
+    def apply_snapshot(self, open_trades: list[dict]):
+        """Diff the book against a full /openTrades listing fetched by the caller."""
+        current = {t["id"]: t for t in open_trades}
+        removed = [self.book.remove(trade_id) for trade_id in list(self.book.trades) if trade_id not in current]
+        added = [t for t in open_trades if self.book.add(t)]
+        if (added or removed) and self.book.synced:
+            logger.info(f"Reconciled with broker: +{len(added)} -{len(removed)} trades, {len(self.book)} open")
+        self.book.synced = True
+        self._notify(added, removed)
+        if self.position_sizer is not None:
+            self.position_sizer.sync_open_trades(len(self.book))
+
+    def on_transaction(self, txn: dict):
+        if txn.get("type") != "ORDER_FILL":
+            return
+        added, removed = [], []
+        for closed in txn.get("tradesClosed") or []:
+            trade = self.book.remove(closed["tradeID"])
+            if trade is not None:
+                removed.append(trade)
+        reduced = txn.get("tradeReduced")
+        if reduced and reduced["tradeID"] in self.book:
+            trade = dict(self.book.trades[reduced["tradeID"]])
+            trade["currentUnits"] = str(float(trade["currentUnits"]) + float(reduced["units"]))
+            self.book.add(trade)
+        opened = txn.get("tradeOpened")
+        if opened:
+            trade = {
+                "id": opened["tradeID"],
+                "instrument": txn["instrument"],
+                "price": opened.get("price", txn.get("price")),
+                "openTime": txn["time"],
+                "initialUnits": opened["units"],
+                "currentUnits": opened["units"],
+                "state": "OPEN",
+            }
+            if self.book.add(trade):
+                added.append(trade)
+        self._notify(added, removed)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,252 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from state_store import StateStore
+
+logger = logging.getLogger("reporting")
+
+REPORT_FILE = "report_state.json"
+
+
+def _bucket() -> dict:
+    return {"start_balance": None, "realized_pl": 0.0, "wins": 0, "losses": 0, "opened": 0, "closed": 0,
+            "instruments": {}}
+
+
+def _instrument_bucket() -> dict:
+    return {"realized_pl": 0.0, "wins": 0, "losses": 0, "opened": 0, "closed": 0, "units": 0.0}
+
+
+def _parse_time(value: str) -> datetime:
+    # OANDA RFC3339 times carry nanoseconds; day/week bucketing only needs the date
+    return datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc)
+
+
+def day_key(when: datetime) -> str:
+    return when.strftime("%Y-%m-%d")
+
+
+def week_key(when: datetime) -> str:
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class Reporter:
+    """Daily and weekly P/L aggregates kept up to date from account transactions.
+
+    on_transaction() (a TransactionIngester listener) folds each fill into the current
+    day and ISO-week buckets, so a report is a lookup plus formatting rather than a scan
+    of history or a round of API calls. Buckets are journaled through a StateStore so
+    totals survive restarts; update_account() feeds the latest balance and unrealized
+    P/L from the cached account summary.
+    """
+
+    def __init__(self, oanda_client=None, trade_book=None, state_file: str | None = REPORT_FILE,
+                 retention_days: int = 35, flush_interval: float = 1.0, defer_load: bool = False):
+        self.oanda = oanda_client
+        self.trade_book = trade_book
+        self.retention_days = retention_days
+        self.state = {"days": {}, "weeks": {}, "last_transaction_id": None}
+        self.balance: Optional[float] = None
+        self.unrealized_pl: Optional[float] = None
+        self.state_store = StateStore(state_file, flush_interval=flush_interval) if state_file else None
+        self.restored = False
+        if not defer_load:
+            self._load_state()
+
+    def _load_state(self):
+        if self.state_store is None or self.restored:
+            return
+        try:
+            self._restore(*self.state_store.load())
+        except Exception as e:
+            logger.warning(f"Failed to load report state: {e}")
+            # Carry on from empty state rather than retrying on every commit
+            self.restored = True
+
+    async def restore(self):
+        """Load persisted buckets off the event loop; for reporters built with defer_load=True."""
+        if self.restored or self.state_store is None:
+            return
+        try:
+            loaded = await asyncio.to_thread(self.state_store.load)
+            # A commit may have loaded synchronously in the meantime; replaying twice would double count
+            if not self.restored:
+                self._restore(*loaded)
+        except Exception as e:
+            logger.warning(f"Failed to load report state: {e}")
+
+    def _restore(self, data, entries):
+        self.restored = True
+        if data is not None:
+            self.state.update(data)
+        for entry in entries:
+            self._apply(entry)
+        if entries:
+            self.state_store.mark_dirty(self._serialize_state)
+
+    def _serialize_state(self) -> dict:
+        return {
+            "days": {k: {**v, "instruments": {i: dict(b) for i, b in v["instruments"].items()}}
+                     for k, v in self.state["days"].items()},
+            "weeks": {k: {**v, "instruments": {i: dict(b) for i, b in v["instruments"].items()}}
+                      for k, v in self.state["weeks"].items()},
+            "last_transaction_id": self.state["last_transaction_id"],
+        }
+
+    def _commit(self, entry: dict):
+        if not self.restored:
+            # Deferred load not done yet: load now, or the first flush would overwrite the file
+            self._load_state()
+        self._apply(entry)
+        if self.state_store is not None:
+            self.state_store.append(entry)
+            self.state_store.mark_dirty(self._serialize_state)
+
+    def _apply(self, entry: dict):
+        last = self.state["last_transaction_id"]
+        if last is not None and int(entry["transaction_id"]) <= int(last):
+            return
+        self.state["last_transaction_id"] = entry["transaction_id"]
+        when = _parse_time(entry["time"])
+        pnls = entry["pnl"]
+        pl = sum(pnls)
+        for buckets, key in ((self.state["days"], day_key(when)), (self.state["weeks"], week_key(when))):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = _bucket()
+            if bucket["start_balance"] is None and entry.get("balance") is not None:
+                # First fill of the period: the balance before it is the period's opening balance
+                bucket["start_balance"] = entry["balance"] - pl
+            inst = bucket["instruments"].get(entry["instrument"])
+            if inst is None:
+                inst = bucket["instruments"][entry["instrument"]] = _instrument_bucket()
+            for target in (bucket, inst):
+                target["realized_pl"] += pl
+                target["wins"] += sum(1 for p in pnls if p > 0)
+                target["losses"] += sum(1 for p in pnls if p <= 0)
+                target["closed"] += len(pnls)
+                target["opened"] += 1 if entry.get("opened") else 0
+            inst["units"] += abs(entry.get("units", 0.0))
+        self._prune(when)
+
+    def _prune(self, now: datetime):
+        cutoff = now - timedelta(days=self.retention_days)
+        oldest_day, oldest_week = day_key(cutoff), week_key(cutoff)
+        for key in [k for k in self.state["days"] if k < oldest_day]:
+            del self.state["days"][key]
+        for key in [k for k in self.state["weeks"] if k < oldest_week]:
+            del self.state["weeks"][key]
+
+    async def close(self):
+        if self.state_store is not None:
+            await self.state_store.close()
+
+    def on_transaction(self, txn: dict):
+        if txn.get("type") != "ORDER_FILL" or "instrument" not in txn:
+            return
+        closed = list(txn.get("tradesClosed") or [])
+        if txn.get("tradeReduced"):
+            closed.append(txn["tradeReduced"])
+        balance = txn.get("accountBalance")
+        if balance is not None:
+            self.balance = float(balance)
+        self._commit({
+            "op": "fill",
+            "transaction_id": txn["id"],
+            "time": txn["time"],
+            "instrument": txn["instrument"],
+            "units": float(txn.get("units", 0)),
+            "pnl": [float(t.get("realizedPL", 0)) for t in closed],
+            "opened": txn.get("tradeOpened") is not None,
+            "balance": float(balance) if balance is not None else None,
+        })
+
+    def update_account(self, summary: Optional[dict]):
+        if summary is None:
+            return
+        self.balance = float(summary["balance"])
+        if "unrealizedPL" in summary:
+            self.unrealized_pl = float(summary["unrealizedPL"])
+
+    def _report(self, bucket: Optional[dict], title: str, current: bool) -> dict:
+        if bucket is None:
+            bucket = _bucket()
+        start_balance = bucket["start_balance"]
+        if start_balance is None and self.balance is not None:
+            start_balance = self.balance - bucket["realized_pl"]
+        closed = bucket["wins"] + bucket["losses"]
+        win_rate = bucket["wins"] / closed if closed else None
+        realized_roi = bucket["realized_pl"] / start_balance if start_balance else None
+        expected_roi = realized_roi
+        if current and realized_roi is not None and self.unrealized_pl is not None:
+            # Open positions count towards the current period at their mark-to-market value
+            expected_roi = (bucket["realized_pl"] + self.unrealized_pl) / start_balance
+        exposure = self.exposure() if current else {}
+
+        lines = [f"Realized P/L: {bucket['realized_pl']:+.2f}"]
+        if realized_roi is not None:
+            lines[0] += f" ({realized_roi * 100:+.2f}%)"
+        lines.append(f"Trades: {bucket['opened']} opened, {bucket['closed']} closed")
+        if win_rate is not None:
+            lines.append(f"Win rate: {win_rate * 100:.0f}% ({bucket['wins']}W/{bucket['losses']}L)")
+        for instrument, stats in sorted(bucket["instruments"].items(), key=lambda kv: -kv[1]["realized_pl"]):
+            lines.append(f"• {instrument}: {stats['realized_pl']:+.2f} ({stats['wins']}W/{stats['losses']}L)")
+        if exposure:
+            lines.append("Exposure: " + ", ".join(f"{inst} {units:+,.0f}" for inst, units in sorted(exposure.items())))
+
+        return {
+            "period": title,
+            "realized_pl": bucket["realized_pl"],
+            "realized_roi": realized_roi,
+            "expected_roi": expected_roi,
+            "wins": bucket["wins"],
+            "losses": bucket["losses"],
+            "win_rate": win_rate,
+            "trades_opened": bucket["opened"],
+            "trades_closed": bucket["closed"],
+            "by_instrument": {k: dict(v) for k, v in bucket["instruments"].items()},
+            "exposure": exposure,
+            "performance_log": "\n".join(lines) if bucket["opened"] or bucket["closed"] else
+                               "No trading activity in this period.",
+        }
+
+    def daily_report(self, now: Optional[datetime] = None) -> dict:
+        key = day_key(now or datetime.now(timezone.utc))
+        return self._report(self.state["days"].get(key), key, now is None)
+
+    def weekly_report(self, now: Optional[datetime] = None) -> dict:
+        key = week_key(now or datetime.now(timezone.utc))
+        return self._report(self.state["weeks"].get(key), key, now is None)
+
+    def exposure(self) -> dict[str, float]:
+        """Net open units per instrument, from the reconciled trade book."""
+        if self.trade_book is None:
+            return {}
+        return {inst: units for inst, units in self.trade_book.net_units.items() if units}
+
+    def open_trades(self) -> list[dict]:
+        """Open trades from the trade book, marked against the cached price table."""
+        if self.trade_book is None:
+            return []
+        trades = []
+        for trade in self.trade_book.values():
+            units = float(trade["currentUnits"])
+            entry = float(trade["price"])
+            roi = None
+            price = self.oanda.price_feed.get_price(trade["instrument"]) if self.oanda is not None else None
+            if price is not None and entry:
+                roi = (price - entry) / entry * (1 if units > 0 else -1)
+            pl = trade.get("unrealizedPL")
+            trades.append({
+                "id": trade["id"],
+                "instrument": trade["instrument"],
+                "units": int(units),
+                "price": entry,
+                "expected_roi": roi,
+                # As of the last broker reconciliation; None for trades seen only via transactions
+                "unrealized_pl": float(pl) if pl is not None else None,
+            })
+        return trades
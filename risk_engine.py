@@ -0,0 +1,173 @@
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+
+from instrument_selector import CURRENCY_PAIRS
+
+logger = logging.getLogger("risk_engine")
+
+Z_99 = 2.326  # one-sided 99% normal quantile
+
+
+class RiskEngine:
+    """Pre-trade portfolio limits evaluated on a net exposure vector per currency.
+
+    Open positions (net units per instrument) map onto currencies through a fixed
+    instrument x currency incidence matrix: a position is long its base currency and
+    short its quote currency, both worth the same USD notional. A proposed order adds
+    x USD of notional along one row of that matrix, so every limit is a closed-form
+    bound on x:
+
+    - currency limits: |exposure_c| <= max_currency_exposure * NAV for every currency
+    - VaR: z * sqrt(e' S e) <= max_var * NAV, with S the covariance of daily currency
+      returns against USD, estimated from stored candles and cached for cov_ttl seconds
+    - margin: the order's margin leaves at least min_margin_headroom * NAV available
+
+    A limit that is already breached is never pushed further, but orders that reduce
+    the breach still pass. check() returns the largest part of the order that fits.
+    """
+
+    def __init__(self, price_feed, trade_book=None, candle_store=None, instruments: list[str] = CURRENCY_PAIRS,
+                 max_currency_exposure: float = 3.0, max_var: float = 0.05, min_margin_headroom: float = 0.2,
+                 margin_rate: float = 0.0333, granularity: str = "M5", cov_window: int = 2016,
+                 var_horizon: float = 86400.0, cov_ttl: float = 3600.0):
+        self.price_feed = price_feed
+        self.trade_book = trade_book
+        self.candle_store = candle_store
+        self.instruments = list(instruments)
+        self.index = {inst: j for j, inst in enumerate(self.instruments)}
+        self.currencies = sorted({c for inst in self.instruments for c in inst.split("_")} | {"USD"})
+        self.currency_index = {c: i for i, c in enumerate(self.currencies)}
+        self.max_currency_exposure = max_currency_exposure
+        self.max_var = max_var
+        self.min_margin_headroom = min_margin_headroom
+        self.margin_rate = margin_rate
+        self.granularity = granularity
+        self.cov_window = cov_window
+        self.var_horizon = var_horizon
+        self.cov_ttl = cov_ttl
+
+        n, k = len(self.instruments), len(self.currencies)
+        self.incidence = np.zeros((n, k))  # +1 on the base currency, -1 on the quote currency
+        self.base = np.zeros(n, dtype=np.int64)
+        for j, inst in enumerate(self.instruments):
+            base, quote = inst.split("_")
+            self.incidence[j, self.currency_index[base]] = 1.0
+            self.incidence[j, self.currency_index[quote]] = -1.0
+            self.base[j] = self.currency_index[base]
+        # How each currency is valued in USD: the pair quoting it against USD and whether it is inverted
+        self.usd_legs = {}
+        for c in self.currencies:
+            if f"{c}_USD" in self.index:
+                self.usd_legs[c] = (f"{c}_USD", False)
+            elif f"USD_{c}" in self.index:
+                self.usd_legs[c] = (f"USD_{c}", True)
+        self.covariance: Optional[np.ndarray] = None
+        self._cov_time = 0.0
+        self.last_check: dict = {}
+
+    def usd_rates(self) -> np.ndarray:
+        """USD value of one unit of each currency from the latest quotes; NaN where unknown or stale."""
+        rates = np.full(len(self.currencies), np.nan)
+        rates[self.currency_index["USD"]] = 1.0
+        for c, (pair, inverted) in self.usd_legs.items():
+            mid = self.price_feed.get_price(pair)
+            if mid is not None:
+                rates[self.currency_index[c]] = 1.0 / mid if inverted else mid
+        return rates
+
+    def exposure(self, rates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Net USD exposure per currency from the reconciled open positions."""
+        if rates is None:
+            rates = self.usd_rates()
+        units = np.zeros(len(self.instruments))
+        if self.trade_book is not None:
+            for inst, net in self.trade_book.net_units.items():
+                j = self.index.get(inst)
+                if j is not None:
+                    units[j] = net
+        notional = np.nan_to_num(units * rates[self.base])
+        return self.incidence.T @ notional
+
+    def refresh_covariance(self) -> Optional[np.ndarray]:
+        """Covariance of per-horizon log returns of each currency against USD, from stored closes."""
+        self._cov_time = time.monotonic()
+        if self.candle_store is None:
+            return self.covariance
+        series = {}
+        for c, (pair, inverted) in self.usd_legs.items():
+            cols = self.candle_store.tail(pair, self.granularity, self.cov_window + 1)
+            if len(cols["c"]) > 1:
+                series[c] = (cols["t"], cols["c"], inverted)
+        if len(series) < 2:
+            return self.covariance
+        # Align on timestamps present in every series so returns are contemporaneous
+        common = series[next(iter(series))][0]
+        for t, _, _ in series.values():
+            common = np.intersect1d(common, t, assume_unique=True)
+        if len(common) < 3:
+            return self.covariance
+        k = len(self.currencies)
+        returns = np.zeros((len(common) - 1, k))
+        for c, (t, close, inverted) in series.items():
+            aligned = np.asarray(close)[np.searchsorted(t, common)]
+            r = np.diff(np.log(aligned))
+            returns[:, self.currency_index[c]] = -r if inverted else r
+        step = float(np.median(np.diff(common)))
+        self.covariance = np.cov(returns, rowvar=False) * (self.var_horizon / step)
+        return self.covariance
+
+    def _cov(self) -> Optional[np.ndarray]:
+        if self.covariance is None or time.monotonic() - self._cov_time > self.cov_ttl:
+            try:
+                self.refresh_covariance()
+            except Exception as e:
+                logger.warning(f"Covariance refresh failed: {e}")
+        return self.covariance
+
+    def check(self, instrument: str, units: int, account: Optional[dict]) -> tuple[int, Optional[str]]:
+        """Largest part of `units` that keeps every limit; returns (units, binding limit or None)."""
+        j = self.index.get(instrument)
+        if j is None or units == 0 or account is None:
+            return units, None
+        rates = self.usd_rates()
+        base_rate = rates[self.base[j]]
+        account_rate = rates[self.currency_index.get(account.get("currency", "USD"), self.currency_index["USD"])]
+        if np.isnan(base_rate) or np.isnan(account_rate):
+            return units, None
+        nav = float(account.get("NAV", account["balance"])) * float(account_rate)
+        margin_available = float(account.get("marginAvailable", 0.0)) * float(account_rate)
+        margin_rate = float(account.get("marginRate", self.margin_rate))
+
+        e = self.exposure(rates)
+        a = self.incidence[j] * np.sign(units)  # exposure added per USD of order notional
+        bounds = {}
+
+        # Currency limits: |e_c + a_c x| <= L_c, with L_c never below the current exposure
+        limit = np.maximum(self.max_currency_exposure * nav, np.abs(e))
+        moved = a != 0
+        bounds["currency"] = float(np.min(limit[moved] - a[moved] * e[moved]))
+
+        # VaR: A x^2 + B x + C <= 0, largest root
+        cov = self._cov()
+        if cov is not None:
+            cap = max((self.max_var * nav / Z_99) ** 2, float(e @ cov @ e))
+            A = float(a @ cov @ a)
+            B = 2.0 * float(a @ cov @ e)
+            C = float(e @ cov @ e) - cap
+            if A > 0:
+                bounds["var"] = (-B + float(np.sqrt(max(B * B - 4 * A * C, 0.0)))) / (2 * A)
+
+        # Margin headroom
+        bounds["margin"] = float(max(0.0, margin_available - self.min_margin_headroom * nav) / margin_rate)
+
+        binding = min(bounds, key=bounds.get)
+        max_notional = max(0.0, bounds[binding])
+        allowed = min(abs(units), int(max_notional / base_rate))
+        self.last_check = {"instrument": instrument, "requested": units, "allowed": allowed, "bounds_usd": bounds}
+        if allowed < abs(units):
+            logger.info(f"Risk engine caps {instrument} at {allowed} of {abs(units)} units ({binding} limit)")
+            return int(np.sign(units)) * allowed, binding
+        return units, None
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from background import BackgroundTask
+
+logger = logging.getLogger("scheduler")
+
+
+class Job(BackgroundTask):
+    """A coroutine function run every `interval` seconds (±jitter) in its own task.
+
+    Runs never overlap: a run that outlasts its interval is counted as an overrun and the
+    next one starts straight after it instead of bursting to catch up. trigger() wakes the
+    job early; triggers arriving mid-run coalesce into one follow-up run. With interval=None
+    the job only runs when triggered. Listeners get callback(job, result, triggered) after
+    every run; a run that failed or timed out passes result=None and leaves job.last_error set.
+    """
+
+    def __init__(self, name: str, func, interval: Optional[float], jitter: float = 0.1,
+                 initial_delay: float = 0.0, timeout: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.timeout = timeout
+        self.listeners = []
+        self.last_result = None
+        self.last_error: Optional[str] = None
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.in_progress = False
+        self._triggered = False
+        self._wake = asyncio.Event()
+        self.task_name = f"job:{name}"
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def trigger(self):
+        self._triggered = True
+        self._wake.set()
+
+    def _next_delay(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def _wait(self, delay: Optional[float]):
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self):
+        triggered, self._triggered = self._triggered, False
+        self.in_progress = True
+        started = time.perf_counter()
+        result = None
+        try:
+            if self.timeout is not None:
+                result = await asyncio.wait_for(self.func(), self.timeout)
+            else:
+                result = await self.func()
+            self.last_result = result
+            self.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.failures += 1
+            self.last_error = f"timed out after {self.timeout}s"
+            logger.error(f"Job {self.name} timed out after {self.timeout}s")
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.exception(f"Job {self.name} failed: {e}")
+        finally:
+            self.in_progress = False
+            self.last_duration = time.perf_counter() - started
+            self.last_run = datetime.now(timezone.utc)
+            self.runs += 1
+        for callback in self.listeners:
+            try:
+                callback(self, result, triggered)
+            except Exception as e:
+                logger.error(f"Listener for job {self.name} failed: {e}")
+
+    async def _run(self):
+        if self.interval is None:
+            await self._wait(None)
+        elif self.initial_delay:
+            await self._wait(self.initial_delay)
+        while True:
+            self._wake.clear()
+            started = time.monotonic()
+            await self._execute()
+            if self.interval is None:
+                await self._wait(None)
+                continue
+            remaining = started + self._next_delay() - time.monotonic()
+            if remaining <= 0:
+                self.overruns += 1
+                logger.warning(f"Job {self.name} overran its {self.interval}s interval ({self.last_duration:.1f}s)")
+            await self._wait(max(remaining, 0))
+
+
+class Scheduler:
+    """Owns the bot's periodic jobs and cancels them together on shutdown."""
+
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+
+    def add(self, name: str, func, interval: Optional[float], **options) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"Job {name} already scheduled")
+        job = self.jobs[name] = Job(name, func, interval, **options)
+        return job
+
+    def trigger(self, name: str) -> bool:
+        job = self.jobs.get(name)
+        if job is None:
+            return False
+        job.trigger()
+        return True
+
+    def start(self):
+        for job in self.jobs.values():
+            job.start()
+
+    async def stop(self):
+        await asyncio.gather(*(job.stop() for job in self.jobs.values()))
+
+    def status(self) -> dict[str, dict]:
+        return {
+            name: {
+                "interval": job.interval,
+                "runs": job.runs,
+                "failures": job.failures,
+                "overruns": job.overruns,
+                "in_progress": job.in_progress,
+                "last_run": job.last_run,
+                "last_duration": job.last_duration,
+                "last_error": job.last_error,
+            }
+            for name, job in self.jobs.items()
+        }
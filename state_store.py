@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Optional
+
+logger = logging.getLogger("state_store")
+
+
+class StateStore:
+    """Coalesced, atomic JSON persistence with an optional append-only journal.
+
+    Mutations are appended to the journal as they happen and the full snapshot is
+    rewritten at most once per flush interval, off the event loop, via temp file +
+    rename. On load, journal entries newer than the snapshot are returned for replay.
+
+    Journal lines are serialized on append but written by a single writer task in a
+    worker thread, batching whatever accumulated while the previous write ran. An entry
+    therefore reaches the file one thread hop after append() rather than before it returns.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, journal: bool = True):
+        self.path = path
+        self.journal_path = f"{path}.journal" if journal else None
+        self.flush_interval = flush_interval
+        self.seq = 0
+        self._serialize: Optional[Callable[[], dict]] = None
+        self._dirty = False
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self._journal = None
+        self._pending: list[str] = []
+        self._journal_task: Optional[asyncio.Task] = None
+
+    def load(self) -> tuple[Optional[dict], list[dict]]:
+        data = None
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.seq = data.pop("journal_seq", 0)
+        saved_seq = self.seq
+        entries = []
+        if self.journal_path and os.path.isfile(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crash mid-append leaves at most one torn trailing line
+                        logger.warning("Ignoring truncated journal entry")
+                        break
+                    if entry.get("seq", 0) > saved_seq:
+                        entries.append(entry)
+                        self.seq = max(self.seq, entry["seq"])
+        return data, entries
+
+    def append(self, entry: dict):
+        if not self.journal_path:
+            return
+        self.seq += 1
+        entry["seq"] = self.seq
+        line = json.dumps(entry)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, backtests): write through immediately
+            self._write_journal([line])
+            return
+        self._pending.append(line)
+        if self._journal_task is None:
+            self._journal_task = loop.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        try:
+            while self._pending:
+                lines, self._pending = self._pending, []
+                await asyncio.to_thread(self._write_journal, lines)
+        finally:
+            self._journal_task = None
+
+    async def _journal_written(self):
+        while self._journal_task is not None:
+            await self._journal_task
+
+    def _write_journal(self, lines: list[str]):
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")
+            self._journal.write("".join(f"{line}\n" for line in lines))
+            self._journal.flush()
+        except Exception as e:
+            logger.warning(f"Failed to append to journal: {e}")
+
+    def mark_dirty(self, serialize: Callable[[], dict]):
+        self._serialize = serialize
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, backtests): write through immediately
+            self.flush_sync()
+            return
+        if self._handle is None and self._flushing is None:
+            self._handle = loop.call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self):
+        self._handle = None
+        self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        try:
+            while self._dirty:
+                self._dirty = False
+                data = self._serialize()
+                seq = self.seq
+                data["journal_seq"] = seq
+                try:
+                    await asyncio.to_thread(self._write, data)
+                except Exception as e:
+                    logger.warning(f"Failed to save trade state: {e}")
+                    return
+                if seq == self.seq:
+                    # Let queued lines land first so truncation cannot race the writer thread
+                    await self._journal_written()
+                    if seq == self.seq:
+                        self._truncate_journal()
+                logger.debug("Trade state saved")
+                if self._dirty:
+                    await asyncio.sleep(self.flush_interval)
+        finally:
+            if self._flushing is asyncio.current_task():
+                self._flushing = None
+
+    def flush_sync(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        data = self._serialize()
+        data["journal_seq"] = self.seq
+        try:
+            self._write(data)
+            self._truncate_journal()
+        except Exception as e:
+            logger.warning(f"Failed to save trade state: {e}")
+
+    def _write(self, data: dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _truncate_journal(self):
+        if not self.journal_path:
+            return
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.isfile(self.journal_path):
+            open(self.journal_path, "w").close()
+
+    async def close(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._flushing is not None:
+            await self._flushing
+        if self._dirty:
+            await self.flush()
+        await self._journal_written()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
@@ -1,18 +1,28 @@
+import asyncio
 import os
 import logging
+from functools import partial
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram.error import TelegramError
-from trading_bot import TradingBot
+from accounts import AccountRegistry
 
 logger = logging.getLogger(__name__)
 
 class TelegramBot:
-    def __init__(self):
+    def __init__(self, accounts: AccountRegistry):
         self.token = os.getenv("TELEGRAM_BOT_TOKEN")
         self.chat_id = int(os.getenv("TELEGRAM_CHAT_ID", "0"))
-        self.trading_bot = TradingBot()
+        # Commands read restored state and /maketrade triggers scheduler jobs, so the registry
+        # must be started first (see bot_runner.main)
+        if not accounts.started:
+            raise ValueError("TelegramBot needs a started AccountRegistry")
+        self.accounts = accounts
+        self.trading_bot = self.accounts.primary
         self.last_trade_info = None
+        self.scheduler = None
+        self.pending_trade_chats = {account_id: set() for account_id in self.accounts.bots}
+        self._send_tasks = set()
 
         self.app = Application.builder().token(self.token).build()
 
@@ -23,15 +33,66 @@ class TelegramBot:
         self.app.add_handler(CommandHandler("opentrades", self.open_trades))
         self.app.add_handler(CommandHandler("daily", self.daily_report))
         self.app.add_handler(CommandHandler("weekly", self.weekly_report))
+        self.app.add_handler(CommandHandler("metrics", self.metrics))
         self.app.add_error_handler(self.error_handler)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text("🤖 Bot is live. Use /maketrade to place a trade.")
+        msg = "🤖 Bot is live. Use /maketrade to place a trade."
+        if len(self.accounts) > 1:
+            msg += f"\n🗂️ Accounts: {', '.join(self.accounts.bots)}. Add an account id or 'all' to any command; /maketrade alone trades {self.accounts.primary.account_id}."
+        await update.message.reply_text(msg)
+
+    async def _targets(self, update: Update, context: ContextTypes.DEFAULT_TYPE, all_by_default: bool = True):
+        """Bots named by the command's first argument (account id, suffix, index or 'all').
+
+        Without an argument read-only commands cover every account; commands that act
+        (all_by_default=False) only touch the primary, so fanning out takes an explicit 'all'.
+        """
+        target = context.args[0] if context.args else None
+        if target is None and not all_by_default:
+            return [self.accounts.primary]
+        bots = self.accounts.resolve(target)
+        if not bots:
+            await update.message.reply_text(f"❓ Unknown account {target}. Accounts: {', '.join(self.accounts.bots)}")
+        return bots
+
+    def _label(self, bot) -> str:
+        return f"[{bot.account_id}] " if len(self.accounts) > 1 else ""
+
+    def attach_scheduler(self, scheduler):
+        """Route /maketrade through each account's entry job and announce what it places."""
+        self.scheduler = scheduler
+        for bot in self.accounts.bots.values():
+            bot.jobs["entry"].subscribe(partial(self._on_entry, bot))
 
     async def trade(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        result = await self.trading_bot.run()
+        bots = await self._targets(update, context, all_by_default=False)
+        if not bots:
+            return
+        if self.scheduler is None:
+            for bot in bots:
+                self._report_trade(bot, await bot.run(), [update.effective_chat.id])
+            return
+        for bot in bots:
+            self.pending_trade_chats[bot.account_id].add(update.effective_chat.id)
+            bot.jobs["entry"].trigger()
+        await update.message.reply_text("⏳ Trade scan queued, I'll report back when it completes.")
+
+    def _on_entry(self, bot, job, result, triggered):
+        chats, self.pending_trade_chats[bot.account_id] = self.pending_trade_chats[bot.account_id], set()
+        if result is None and job.last_error:
+            for chat in chats:
+                self._send(chat, f"{self._label(bot)}❌ Trade scan failed: {job.last_error}")
+            return
+        if result and self.chat_id:
+            # Scheduled scans that place a trade are announced to the owner's chat too
+            chats.add(self.chat_id)
+        self._report_trade(bot, result, chats)
+
+    def _report_trade(self, bot, result, chats):
         if not result:
-            await update.message.reply_text("⚠️ No trade executed.")
+            for chat in chats:
+                self._send(chat, f"{self._label(bot)}⚠️ No trade executed.")
             return
         
         instrument = getattr(result, "instrument", "unknown")
@@ -40,7 +101,7 @@ class TelegramBot:
         expected_roi = getattr(result, "expected_roi", None)  # Decimal e.g. 0.12 for 12%
         pl_pct = expected_roi * 100 if expected_roi is not None else None
         
-        trade_msg = f"📈 Trade executed on {instrument}\n"
+        trade_msg = f"{self._label(bot)}📈 Trade executed on {instrument}\n"
         trade_msg += f"💰 Units bought: {units}\n"
         if cost_in_gbp is not None:
             trade_msg += f"💷 Invested: £{cost_in_gbp:,.2f}\n"
@@ -49,28 +110,56 @@ class TelegramBot:
         trade_msg += "🔎 Monitor closely and adjust risk accordingly."
         
         self.last_trade_info = trade_msg
-        await update.message.reply_text(trade_msg)
+        for chat in chats:
+            self._send(chat, trade_msg)
+
+    def _send(self, chat_id: int, text: str):
+        task = asyncio.create_task(self.app.bot.send_message(chat_id, text))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._sent)
+
+    def _sent(self, task):
+        self._send_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Telegram send failed: {task.exception()}")
 
     async def status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        bots = await self._targets(update, context)
+        if not bots:
+            return
         # Removed error summary as requested
         msg = "📊 Status Report:\n✅ All systems up to date and running smoothly."
+        for bot in bots:
+            status = bot.status  # refreshed by the scheduler's status job
+            if status:
+                if len(self.accounts) > 1:
+                    msg += f"\n\n🗂️ {bot.account_id}"
+                if status.get("balance") is not None:
+                    msg += f"\n💷 Balance: £{status['balance']:,.2f} | NAV: £{status['nav']:,.2f}"
+                msg += f"\n📂 Open trades: {status['open_trades']}"
+                msg += f"\n🕒 Updated {status['updated']:%H:%M:%S} UTC"
         await update.message.reply_text(msg)
 
     async def open_trades(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        trades = await self.trading_bot.get_open_trades()
+        bots = await self._targets(update, context)
+        if not bots:
+            return
+        trades = []
+        for bot in bots:
+            trades.extend((bot, t) for t in await bot.get_open_trades())
         if not trades:
             await update.message.reply_text("📭 No open trades at the moment.")
             return
         
         msg = "📂 Open Trades:\n"
-        for t in trades:
+        for bot, t in trades:
             instr = t.get("instrument", "unknown")
             units = t.get("units", 0)
             roi = t.get("expected_roi", None)
             roi_pct = roi * 100 if roi is not None else None
             pl = t.get("unrealized_pl", None)
             pl_str = f"PL: £{pl:.2f}" if pl is not None else "PL: N/A"
-            msg += f"• {instr} | Units: {units} | "
+            msg += f"• {self._label(bot)}{instr} | Units: {units} | "
             if roi_pct is not None:
                 msg += f"Expected ROI: {roi_pct:.2f}% | "
             msg += f"{pl_str}\n"
@@ -78,31 +167,40 @@ class TelegramBot:
         await update.message.reply_text(msg)
 
     async def daily_report(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        report = await self.trading_bot.get_daily_report()
-        roi = report.get("expected_roi", None)
-        roi_pct = roi * 100 if roi is not None else None
-        performance = report.get("performance_log", "No performance data available.")
-        msg = "📅 Daily Report:\n"
-        if roi_pct is not None:
-            msg += f"🎯 Expected ROI Today: {roi_pct:.2f}%\n"
-        msg += f"📈 Performance Summary:\n{performance}"
-        await update.message.reply_text(msg)
+        for bot in await self._targets(update, context):
+            report = await bot.get_daily_report()
+            roi = report.get("expected_roi", None)
+            roi_pct = roi * 100 if roi is not None else None
+            performance = report.get("performance_log", "No performance data available.")
+            msg = f"{self._label(bot)}📅 Daily Report:\n"
+            if roi_pct is not None:
+                msg += f"🎯 Expected ROI Today: {roi_pct:.2f}%\n"
+            msg += f"📈 Performance Summary:\n{performance}"
+            await update.message.reply_text(msg)
 
     async def weekly_report(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        report = await self.trading_bot.get_weekly_report()
-        roi = report.get("expected_roi", None)
-        roi_pct = roi * 100 if roi is not None else None
-        performance = report.get("performance_log", "No performance data available.")
-        msg = "📆 Weekly Report:\n"
-        if roi_pct is not None:
-            msg += f"🎯 Expected ROI This Week: {roi_pct:.2f}%\n"
-        msg += f"📊 Performance Summary:\n{performance}"
-        await update.message.reply_text(msg)
+        for bot in await self._targets(update, context):
+            report = await bot.get_weekly_report()
+            roi = report.get("expected_roi", None)
+            roi_pct = roi * 100 if roi is not None else None
+            performance = report.get("performance_log", "No performance data available.")
+            msg = f"{self._label(bot)}📆 Weekly Report:\n"
+            if roi_pct is not None:
+                msg += f"🎯 Expected ROI This Week: {roi_pct:.2f}%\n"
+            msg += f"📊 Performance Summary:\n{performance}"
+            await update.message.reply_text(msg)
+
+    async def metrics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await update.message.reply_text(f"⏱️ Latency Metrics:\n{self.trading_bot.metrics_report()}")
 
     async def diagnostics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        bots = await self._targets(update, context)
+        if not bots:
+            return
         await update.message.reply_text("🔍 Running diagnostics...")
-        diag = await self.trading_bot.run_diagnostics()
-        await update.message.reply_text(f"✅ Diagnostics Complete:\n{diag}")
+        for bot in bots:
+            diag = await bot.run_diagnostics()
+            await update.message.reply_text(f"{self._label(bot)}✅ Diagnostics Complete:\n{diag}")
 
     async def error_handler(self, update, context):
         logger.error(f"Telegram error: {context.error}")
@@ -1,8 +1,15 @@
 # trade_closer.py
 
+import asyncio
+import heapq
 import logging
 import re
-from datetime import datetime, timedelta
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from metrics import EXIT_TICK_SECONDS, MONITOR_PASS_SECONDS
 
 logger = logging.getLogger("trade_closer")
 
@@ -20,56 +27,278 @@ class TradeCloser:
         self.trailing_stop_pips = 15
         self.min_profit_threshold = 3.0  # in pips
         self.max_trade_duration = timedelta(hours=2)
-        self.min_risk_reward = 1.2
+        self.max_concurrent_closes = 8
+        self.clock = lambda: datetime.now(timezone.utc)  # backtests substitute simulated time
+        self.last_pass_stats = {}
 
     async def monitor_trades(self):
+        started = time.perf_counter()
         open_trades = await self.oanda.get_open_trades()
+        prices = await self.oanda.get_prices([t["instrument"] for t in open_trades]) if open_trades else {}
+        fetched = time.perf_counter()
+
+        now = self.clock()
+        exits = []
         for trade in open_trades:
-            await self._evaluate_trade(trade)
+            reason = self._exit_reason(trade, prices.get(trade["instrument"]), now)
+            if reason:
+                logger.info(f"Trade {trade['id']} {reason}, closing")
+                exits.append(trade)
+        evaluated = time.perf_counter()
+
+        if exits:
+            await self._close_trades(exits, open_trades)
+        finished = time.perf_counter()
+        MONITOR_PASS_SECONDS.observe(finished - started)
+
+        self.last_pass_stats = {
+            "trades": len(open_trades),
+            "instruments": len(prices),
+            "closes": len(exits),
+            "fetch_ms": (fetched - started) * 1000,
+            "evaluate_ms": (evaluated - fetched) * 1000,
+            "close_ms": (finished - evaluated) * 1000,
+            "total_ms": (finished - started) * 1000,
+        }
+        logger.info(
+            f"Monitor pass: {len(open_trades)} trades, {len(exits)} closes | "
+            f"fetch={self.last_pass_stats['fetch_ms']:.1f}ms eval={self.last_pass_stats['evaluate_ms']:.1f}ms "
+            f"close={self.last_pass_stats['close_ms']:.1f}ms total={self.last_pass_stats['total_ms']:.1f}ms"
+        )
+        return self.last_pass_stats
+
+    def exit_levels(self, trade) -> tuple[float, float]:
+        """(upper, lower) exit prices: a trade closes when price rises to upper or falls to lower.
+
+        Exits are price rules only: a stop trailing_stop_pips from entry and a profit target
+        min_profit_threshold pips from entry. ExitEngine indexes these same levels, so a trade
+        exits on the same prices whether the engine or monitor_trades() is watching it.
+        """
+        entry_price = float(trade["price"])
+        pip_size = 0.01 if trade["instrument"].endswith("JPY") else 0.0001
+        stop_distance = self.trailing_stop_pips * pip_size
+        target_distance = self.min_profit_threshold * pip_size
+        if trade["currentUnits"].startswith("-"):
+            # Short: stop above entry, target below
+            return entry_price + stop_distance, entry_price - target_distance
+        return entry_price + target_distance, entry_price - stop_distance
+
+    def _exit_reason(self, trade, current_price, now):
+        """Return why a trade should be closed, or None to keep it open."""
+        duration = now - parse_oanda_time(trade["openTime"])
+        if duration > self.max_trade_duration:
+            return f"held too long ({duration})"
+
+        if current_price is None:
+            return None
+
+        upper, lower = self.exit_levels(trade)
+        is_short = trade["currentUnits"].startswith("-")
+        if current_price >= upper:
+            return "hit trailing stop (short)" if is_short else f"reached profit target ({current_price})"
+        if current_price <= lower:
+            return f"reached profit target ({current_price})" if is_short else "hit trailing stop (long)"
+        return None
+
+    async def _close_trades(self, trades, open_trades=None):
+        """Close a batch of trades, flattening whole positions where every trade on them is exiting."""
+        results = await self.oanda.close_trades(
+            [t["id"] for t in trades], open_trades=open_trades, max_concurrency=self.max_concurrent_closes
+        )
+        closed = []
+        for trade, (success, _) in zip(trades, results):
+            if success:
+                closed.append(trade["instrument"])
+                logger.info(f"Trade {trade['id']} closed successfully")
+            else:
+                logger.error(f"Failed to close trade {trade['id']}")
+        self.position_sizer.close_trades(closed)
+        return results
+
+class ExitEngine:
+    """Tick-driven exits: per-instrument sorted trigger levels checked on every price update.
+
+    Each open trade contributes a stop level (entry -/+ trailing_stop_pips) and a target
+    level (entry +/- min_profit_threshold pips), from TradeCloser.exit_levels. Levels that fire when price rises are kept
+    in one sorted list per instrument and levels that fire when price falls in another,
+    so a tick only bisects the two lists for its own instrument.
+    """
+
+    def __init__(self, oanda_client, trade_closer: TradeCloser, refresh_interval: float = 10.0, reconciler=None):
+        self.oanda = oanda_client
+        self.closer = trade_closer
+        self.refresh_interval = refresh_interval
+        # With a reconciler the index follows its diffs instead of polling /openTrades itself
+        self.reconciler = reconciler
+        if reconciler is not None:
+            reconciler.subscribe(self.apply_diff)
+        self.trades = {}  # trade_id -> trade
+        self.upper = defaultdict(list)  # instrument -> sorted [(level, trade_id)], fire when price >= level
+        self.lower = defaultdict(list)  # instrument -> sorted [(level, trade_id)], fire when price <= level
+        self.expiries = []  # heap of (expiry datetime, trade_id)
+        self.closing = set()
+        self.closed = set()  # closed by us but still listed (book or /openTrades) until it catches up
+        self.attached = False
+        self._task = None
+        self._close_tasks = set()
 
-    async def _evaluate_trade(self, trade):
+    def start(self, run_loop: bool = True):
+        """Start reacting to ticks. With run_loop=False the caller drives check() on its own schedule."""
+        if not self.attached:
+            self.oanda.price_feed.subscribe(self.on_tick)
+            self.attached = True
+            if self.reconciler is not None:
+                self.sync(list(self.reconciler.book.values()))
+        if run_loop and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="exit_engine")
+        return self._task
+
+    async def stop(self):
+        self.oanda.price_feed.unsubscribe(self.on_tick)
+        self.attached = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.drain()
+
+    @property
+    def running(self) -> bool:
+        return self.attached
+
+    def _levels(self, trade):
+        return self.closer.exit_levels(trade)
+
+    def add_trade(self, trade):
         trade_id = trade["id"]
+        if trade_id in self.trades or trade_id in self.closing or trade_id in self.closed:
+            return
         instrument = trade["instrument"]
-        open_time = parse_oanda_time(trade["openTime"])
-        current_price = await self.oanda.get_price(instrument)
+        upper, lower = self._levels(trade)
+        self.trades[trade_id] = trade
+        insort(self.upper[instrument], (upper, trade_id))
+        insort(self.lower[instrument], (lower, trade_id))
+        expiry = parse_oanda_time(trade["openTime"]) + self.closer.max_trade_duration
+        heapq.heappush(self.expiries, (expiry, trade_id))
 
-        unrealized_pl = float(trade.get("unrealizedPL", 0))
-        initial_margin = float(trade.get("initialMarginRequired", 1))  # Avoid div by zero
-        duration = datetime.now(open_time.tzinfo) - open_time
+    def remove_trade(self, trade_id):
+        trade = self.trades.pop(trade_id, None)
+        if trade is None:
+            return None
+        instrument = trade["instrument"]
+        upper, lower = self._levels(trade)
+        for levels, level in ((self.upper[instrument], upper), (self.lower[instrument], lower)):
+            i = bisect_left(levels, (level, trade_id))
+            if i < len(levels) and levels[i][1] == trade_id:
+                del levels[i]
+        # Expiry heap entries are dropped lazily once the trade is gone
+        return trade
 
-        if duration > self.max_trade_duration:
-            logger.info(f"Trade {trade_id} held too long ({duration}), closing")
-            await self._close_trade(trade_id, instrument)
+    def sync(self, open_trades):
+        """Replace the index with the broker's current open trades."""
+        current = {t["id"] for t in open_trades}
+        self.closed &= current
+        for trade_id in list(self.trades):
+            if trade_id not in current:
+                self.remove_trade(trade_id)
+        for trade in open_trades:
+            self.add_trade(trade)
+
+    def apply_diff(self, added, removed):
+        for trade in removed:
+            self.remove_trade(trade["id"])
+            self.closing.discard(trade["id"])
+            self.closed.discard(trade["id"])
+        for trade in added:
+            self.add_trade(trade)
+
+    async def refresh(self):
+        if self.reconciler is not None:
+            await self.reconciler.reconcile()
+        else:
+            self.sync(await self.oanda.get_open_trades())
+        self._check_expiries()
+
+    def on_tick(self, instrument, bid, ask):
+        upper = self.upper.get(instrument)
+        lower = self.lower.get(instrument)
+        if not upper and not lower:
             return
+        started = time.perf_counter()
+        price = (bid + ask) / 2
+        triggered = []
+        if upper:
+            i = bisect_right(upper, (price, "\uffff"))
+            triggered.extend(trade_id for _, trade_id in upper[:i])
+        if lower:
+            i = bisect_left(lower, (price, ""))
+            triggered.extend(trade_id for _, trade_id in lower[i:])
+        if triggered:
+            logger.info(f"Trades {', '.join(triggered)} crossed exit levels at {price}, closing")
+            self._close(triggered)
+        if self.expiries and self.expiries[0][0] <= self.closer.clock():
+            self._check_expiries()
+        EXIT_TICK_SECONDS.observe(time.perf_counter() - started)
 
-        rr_ratio = unrealized_pl / initial_margin if initial_margin > 0 else 0
+    def _check_expiries(self):
+        now = self.closer.clock()
+        expired = []
+        while self.expiries and self.expiries[0][0] <= now:
+            _, trade_id = heapq.heappop(self.expiries)
+            if trade_id in self.trades:
+                logger.info(f"Trade {trade_id} held too long, closing")
+                expired.append(trade_id)
+        if expired:
+            self._close(expired)
 
-        if unrealized_pl >= self.min_profit_threshold and rr_ratio >= self.min_risk_reward:
-            logger.info(f"Trade {trade_id} meets PL threshold (PL: {unrealized_pl}, RR: {rr_ratio:.2f}), closing")
-            await self._close_trade(trade_id, instrument)
+    def _close(self, trade_ids):
+        trades = [t for t in (self.remove_trade(trade_id) for trade_id in trade_ids) if t is not None]
+        if not trades:
             return
+        self.closing.update(t["id"] for t in trades)
+        task = asyncio.create_task(self._close_and_release(trades))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
 
-        entry_price = float(trade["price"])
-        is_short = trade["currentUnits"].startswith("-")
+    async def _close_and_release(self, trades):
+        try:
+            # No account view passed: the index can miss trades (opened since the last refresh,
+            # placed by hand), so position flattening is decided on a fresh /openTrades listing
+            results = await self.closer._close_trades(trades)
+            # Until the listing drops them, keep closed trades from being re-indexed and closed twice
+            self.closed.update(t["id"] for t, (success, _) in zip(trades, results) if success)
+        finally:
+            # A failed close is picked up again by the next refresh or check(), which re-index
+            # every trade the broker (or the reconciler's book) still lists as open
+            self.closing.difference_update(t["id"] for t in trades)
 
-        pip_size = 0.01 if instrument.endswith("JPY") else 0.0001
-        stop_distance = self.trailing_stop_pips * pip_size
+    async def drain(self):
+        """Wait for the closes triggered so far to finish."""
+        while self._close_tasks:
+            await asyncio.gather(*self._close_tasks, return_exceptions=True)
 
-        if is_short:
-            stop_price = entry_price + stop_distance
-            if current_price >= stop_price:
-                logger.info(f"Trade {trade_id} hit trailing stop (short), closing")
-                await self._close_trade(trade_id, instrument)
-        else:
-            stop_price = entry_price - stop_distance
-            if current_price <= stop_price:
-                logger.info(f"Trade {trade_id} hit trailing stop (long), closing")
-                await self._close_trade(trade_id, instrument)
-
-    async def _close_trade(self, trade_id, instrument):
-        success, _ = await self.oanda.close_trade(trade_id)
-        if success:
-            self.position_sizer.close_trade(instrument)
-            logger.info(f"Trade {trade_id} closed successfully")
+    async def check(self):
+        """Periodic housekeeping: re-sync the index and close expired trades.
+
+        With a reconciler the index is re-synced from its book rather than /openTrades. The
+        book keeps trades whose close failed (no diff will re-add them), so this is what
+        retries those closes, at most once per refresh interval.
+        """
+        if self.reconciler is None:
+            await self.refresh()
         else:
-            logger.error(f"Failed to close trade {trade_id}")
\ No newline at end of file
+            self.sync(list(self.reconciler.book.values()))
+            self._check_expiries()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Exit engine refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
@@ -23,6 +23,22 @@ class TradeExecutor:
         logger.info(f"Trade placed: buy {units} units on {instrument}")
         return True
 
+    async def execute_trades(self, orders: list[tuple[str, int]]) -> list[bool]:
+        """Place several (instrument, units) orders concurrently; returns per-order success in order."""
+        valid = [i for i, (_, units) in enumerate(orders) if units > 0]
+        results = await self.oanda_client.create_trades([orders[i] for i in valid])
+        placed = [False] * len(orders)
+        for i, (success, response) in zip(valid, results):
+            instrument, units = orders[i]
+            if success:
+                placed[i] = True
+                logger.info(f"Trade placed: buy {units} units on {instrument}")
+            else:
+                logger.error(f"Trade failed for {instrument}: {response}")
+        # One state update for the whole batch
+        self.position_sizer.record_trades([orders[i][0] for i in valid if placed[i]])
+        return placed
+
     async def evaluate_exit(self, instrument: str, trade_id: str, entry_price: float):
         """
         Lightweight logic to evaluate if the trade should be closed early
@@ -1,39 +1,269 @@
+import asyncio
 import os
 import logging
-from oanda_client import OandaClient
-from position_sizer import PositionSizer
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from candle_store import CandleStore
+from oanda_client import OandaClient, DEFAULT_BASE_URL, DEFAULT_STREAM_URL
+from instrument_selector import CURRENCY_PAIRS, default_selector
+from metrics import (DECISIONS, DECISION_SECONDS, REQUESTS, REQUESTS_PER_DECISION, SIZING_SECONDS,
+                     LoopLagMonitor, MetricsServer, registry)
+from position_sizer import PositionSizer, STATE_FILE
 from trade_executor import TradeExecutor
-from trade_closer import TradeCloser
+from trade_closer import TradeCloser, ExitEngine
+from transaction_ingester import TransactionIngester
+from reconciler import TradeReconciler
+from reporting import Reporter, REPORT_FILE
+from risk_engine import RiskEngine
 
 logger = logging.getLogger("trading_bot")
 
+@dataclass
+class TradeCandidate:
+    instrument: str
+    units: int
+    confidence: float
+    risk: float
+    score: float = 0.0
+
 class TradingBot:
-    def __init__(self):
+    def __init__(self, state_file: str | None = STATE_FILE, report_file: str | None = REPORT_FILE,
+                 account_id: str | None = None, transport=None, price_feed=None, candle_store=None,
+                 primary: bool = True):
+        """One account's trading stack.
+
+        AccountRegistry passes a shared transport, price feed and candle store when several
+        accounts run in one process; only the primary bot runs the process-wide services
+        (candle backfill, selector updates, loop-lag monitor and metrics endpoint).
+        """
         api_key = os.getenv("OANDA_API_KEY")
-        account_id = os.getenv("OANDA_ACCOUNT_ID")
+        account_id = account_id or os.getenv("OANDA_ACCOUNT_ID")
 
         if not api_key or not account_id:
             raise ValueError("OANDA_API_KEY and OANDA_ACCOUNT_ID must be set in environment variables.")
 
-        self.oanda = OandaClient(api_key, account_id)
-        self.position_sizer = PositionSizer(self.oanda)
+        self.primary = primary
+        self.oanda = OandaClient(
+            api_key,
+            account_id,
+            base_url=os.getenv("OANDA_BASE_URL", DEFAULT_BASE_URL),
+            stream_url=os.getenv("OANDA_STREAM_URL", DEFAULT_STREAM_URL),
+            transport=transport,
+            transport_options={
+                "http2": os.getenv("OANDA_HTTP2", "0") == "1",
+                "max_connections": int(os.getenv("OANDA_MAX_CONNECTIONS", "20")),
+            },
+            price_feed=price_feed,
+        )
+        # State files are read in start(), concurrently with the network warm-up
+        self.position_sizer = PositionSizer(self.oanda, state_file=state_file, defer_load=True)
         self.trade_executor = TradeExecutor(self.oanda, self.position_sizer)
         self.trade_closer = TradeCloser(self.oanda, self.position_sizer)
-        self.instruments = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CHF"]
+        self.reconciler = TradeReconciler(self.oanda, self.position_sizer)
+        self.position_sizer.trade_book = self.reconciler.book
+        self.exit_engine = ExitEngine(self.oanda, self.trade_closer, reconciler=self.reconciler)
+        self.ingester = TransactionIngester(self.oanda, self.position_sizer)
+        self.ingester.subscribe(self.reconciler.on_transaction)
+        self.reporter = Reporter(self.oanda, self.reconciler.book, state_file=report_file if state_file else None,
+                                 defer_load=True)
+        self.ingester.subscribe(self.reporter.on_transaction)
+        self.selector = default_selector
+        self.position_sizer.selector = self.selector
+        self.candle_store = candle_store or CandleStore(os.getenv("CANDLE_STORE_DIR", "candles"))
+        self.position_sizer.candle_store = self.candle_store
+        self.risk_engine = RiskEngine(self.oanda.price_feed, self.reconciler.book, self.candle_store)
+        self.position_sizer.risk_engine = self.risk_engine
+        self.history_days = 3
+        self._backfill_task = None
+        self.instruments = list(CURRENCY_PAIRS)
+        self.stop_loss_pips = 10.0
+        self.max_trades_per_run = 1
+        self.loop_lag = LoopLagMonitor()
+        metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+        self.metrics_server = None
+        if metrics_port and primary:
+            self.metrics_server = MetricsServer(registry, os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port)
+        # Scheduler cadences in seconds. Entry scans only run on request unless ENTRY_INTERVAL
+        # opts in to periodic trading (unset, empty or 0 keeps it manual)
+        entry_interval = os.getenv("ENTRY_INTERVAL")
+        self.entry_interval = float(entry_interval) if entry_interval else None
+        self.status_interval = 30.0
+        self.status = {}
+        self.jobs = {}
+
+    async def start(self, scheduler=None):
+        """Start feeds and background loops. With a scheduler, periodic work is registered as its jobs instead.
+
+        Restoring persisted state and warming the connection pool, price table, account
+        snapshot and open-trade listing all run concurrently, so exit monitoring is live
+        after roughly one round-trip; backfill and the metrics endpoint follow it.
+        """
+        self.oanda.price_feed.subscribe(self.selector.update)
+        _, _, open_trades = await asyncio.gather(
+            self.position_sizer.restore(), self.reporter.restore(), self._warm_up())
+        # Applied only once the sizer is restored, so its open-trade sync lands after the replayed journal
+        if open_trades is not None:
+            self.reconciler.apply_snapshot(open_trades)
+        if scheduler is None:
+            self.reconciler.start()
+            self.exit_engine.start()
+        else:
+            self.exit_engine.start(run_loop=False)
+            self.schedule(scheduler)
+        self.ingester.start()
+        if not self.primary:
+            return
+        self._backfill_task = asyncio.create_task(self.backfill_history())
+        self.loop_lag.start()
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.warning(f"Metrics endpoint unavailable: {e}")
+                self.metrics_server = None
+
+    async def _warm_up(self):
+        await self.oanda.transport.open()
+        # Keep an in-memory price table warm so sizing and exit checks skip the REST round-trip
+        self.oanda.start_price_feed(CURRENCY_PAIRS)
+        account, _, open_trades = await asyncio.gather(
+            self.oanda.get_account_summary(),
+            self.oanda.get_prices(self.instruments),
+            self.oanda.fetch_open_trades(),
+        )
+        self.reporter.update_account(account)
+        return open_trades
+
+    async def stop(self):
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.loop_lag.stop()
+        await self.ingester.stop()
+        await self.exit_engine.stop()
+        await self.reconciler.stop()
+        await self.position_sizer.close()
+        await self.reporter.close()
+        await self.oanda.close()
+
+    def schedule(self, scheduler):
+        """Register this account's periodic jobs; they are also kept in self.jobs by short name."""
+        def add(name, func, interval, **options):
+            self.jobs[name] = scheduler.add(f"{name}:{self.account_id}", func, interval, **options)
+
+        add("reconcile", self.reconciler.reconcile, self.reconciler.interval, timeout=30.0)
+        add("exits", self.exit_engine.check, self.exit_engine.refresh_interval, timeout=30.0)
+        add("entry", self.run, self.entry_interval or None, initial_delay=self.entry_interval or 0.0, timeout=60.0)
+        add("status", self.refresh_status, self.status_interval, timeout=15.0)
+
+    @property
+    def account_id(self) -> str:
+        return self.oanda.account_id
+
+    async def refresh_status(self) -> dict:
+        account = await self.oanda.get_account_summary()
+        self.reporter.update_account(account)
+        self.status = {
+            "updated": datetime.now(timezone.utc),
+            "balance": float(account["balance"]) if account else None,
+            "nav": float(account.get("NAV", account["balance"])) if account else None,
+            "open_trades": self.position_sizer.open_trade_count(),
+            "price_feed": self.oanda.price_feed.running,
+            "ingester": self.ingester.running,
+        }
+        return self.status
+
+    async def get_daily_report(self) -> dict:
+        return self.reporter.daily_report()
+
+    async def get_weekly_report(self) -> dict:
+        return self.reporter.weekly_report()
+
+    async def get_open_trades(self) -> list[dict]:
+        return self.reporter.open_trades()
+
+    async def run_diagnostics(self) -> str:
+        """Health summary from in-memory state only; no API calls."""
+        feed = self.oanda.price_feed
+        ages = [age for age in (feed.age(i) for i in self.instruments) if age is not None]
+        ranked = [i for i in self.selector.rank() if i in self.instruments][:3]
+        lines = [
+            f"Price feed: {'streaming' if feed.running else 'stopped'}, "
+            f"{len(ages)}/{len(self.instruments)} pairs quoted" + (f", oldest {max(ages):.1f}s" if ages else ""),
+            f"Transaction ingester: {'running' if self.ingester.running else 'stopped'}, "
+            f"checkpoint {self.ingester.checkpoint}",
+            f"Open trades: {self.position_sizer.open_trade_count()} "
+            f"(reconciled: {'yes' if self.reconciler.book.synced else 'not yet'})",
+            f"Exit engine: {'watching' if self.exit_engine.running else 'idle'} {len(self.exit_engine.trades)} trades",
+            f"Top ranked pairs: {', '.join(ranked)}",
+            f"Decisions: {DECISIONS.value}, REST requests: {REQUESTS.value}",
+        ]
+        if self.status:
+            lines.append(f"Last account snapshot: {self.status['updated']:%H:%M:%S} UTC")
+        return "\n".join(lines)
+
+    async def backfill_history(self):
+        start = datetime.now(timezone.utc) - timedelta(days=self.history_days)
+        granularity = self.position_sizer.atr_granularity
+        try:
+            await asyncio.gather(*(
+                self.candle_store.backfill(self.oanda, instrument, granularity, start)
+                for instrument in self.instruments
+            ))
+        except Exception as e:
+            logger.warning(f"Candle backfill failed: {e}")
+        self.selector.warm_up(self.candle_store, granularity)
+        self.risk_engine.refresh_covariance()
 
     async def run(self):
-        # Try trades on all instruments, but stop after the first successful trade
-        for instrument in self.instruments:
-            trade_placed = await self._try_trade(instrument)
-            if trade_placed:
-                break
-        # Monitor and close trades
-        await self.trade_closer.monitor_trades()
-
-    async def _try_trade(self, instrument):
-        stop_loss_pips = 10.0
-        units = await self.position_sizer.calculate_units(instrument, stop_loss_pips)
-        if units > 0:
-            await self.trade_executor.execute_trade(instrument, units)
-            return True
-        return False
\ No newline at end of file
+        started = time.perf_counter()
+        # Counts every REST call made meanwhile, background loops included
+        requests_before = REQUESTS.value
+        candidates = await self.scan()
+        placed = await self.place(candidates)
+        if self.exit_engine.running:
+            # Index the new trade now instead of waiting for the engine's next refresh
+            await self.exit_engine.refresh()
+        else:
+            await self.trade_closer.monitor_trades()
+        DECISIONS.inc()
+        DECISION_SECONDS.observe(time.perf_counter() - started)
+        REQUESTS_PER_DECISION.observe(REQUESTS.value - requests_before)
+        return placed[0] if placed else None
+
+    def metrics_report(self) -> str:
+        return registry.summary()
+
+    async def scan(self) -> list[TradeCandidate]:
+        """Size every instrument concurrently and return the tradeable ones, best first."""
+        # Warm the account snapshot and price table once so every sizing call below reads cached data
+        await asyncio.gather(self.oanda.get_account_summary(), self.oanda.get_prices(self.instruments))
+        instruments = [i for i in self.selector.rank() if i in self.instruments]
+        results = await asyncio.gather(*(self._size(instrument) for instrument in instruments))
+        candidates = [c for c in results if c is not None]
+        # The sizer already dropped pairs under its confidence floor; among the rest the selector's
+        # trend score decides (risk follows from confidence, so it adds nothing as a key)
+        candidates.sort(key=lambda c: -c.score)
+        return candidates
+
+    async def place(self, candidates: list[TradeCandidate]) -> list[TradeCandidate]:
+        selected = candidates[:self.max_trades_per_run]
+        results = await self.trade_executor.execute_trades([(c.instrument, c.units) for c in selected])
+        return [c for c, placed in zip(selected, results) if placed]
+
+    async def _size(self, instrument) -> TradeCandidate | None:
+        started = time.perf_counter()
+        units = await self.position_sizer.calculate_units(instrument, self.stop_loss_pips)
+        SIZING_SECONDS.observe(time.perf_counter() - started)
+        if units <= 0:
+            return None
+        return TradeCandidate(
+            instrument=instrument,
+            units=units,
+            confidence=self.position_sizer.get_confidence(instrument),
+            risk=self.position_sizer.get_risk(instrument),
+            score=self.position_sizer.get_score(instrument),
+        )
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+
+import httpx
+
+from background import Backoff, BackgroundTask
+
+logger = logging.getLogger("transaction_ingester")
+
+
+class TransactionIngester(BackgroundTask):
+    """Follows the account's transactions and feeds realized P/L into PositionSizer.record_closes.
+
+    On every (re)connect it catches up from the persisted last-transaction-id checkpoint via
+    /transactions/sinceid, then follows /transactions/stream. With use_stream=False it polls
+    sinceid every poll_interval instead. The checkpoint lives in the PositionSizer state so it
+    is saved atomically with the counts it produced.
+    """
+
+    task_name = "transaction_ingester"
+
+    def __init__(self, oanda_client, position_sizer, use_stream: bool = True, poll_interval: float = 5.0,
+                 heartbeat_timeout: float = 20.0, min_backoff: float = 0.5, max_backoff: float = 30.0):
+        self.oanda = oanda_client
+        self.position_sizer = position_sizer
+        self.use_stream = use_stream
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.listeners = []
+        self.processed = 0
+
+    def subscribe(self, callback):
+        """Register callback(transaction), called for every new transaction in id order."""
+        self.listeners.append(callback)
+
+    @property
+    def checkpoint(self) -> Optional[str]:
+        return self.position_sizer.get_transaction_checkpoint()
+
+    async def _initial_checkpoint(self) -> Optional[str]:
+        if self.checkpoint is not None:
+            return self.checkpoint
+        # First run: start from now rather than rescanning the account's whole history
+        account = await self.oanda.get_account_summary()
+        if account is None or "lastTransactionID" not in account:
+            return None
+        self.position_sizer.set_transaction_checkpoint(account["lastTransactionID"])
+        logger.info(f"Transaction checkpoint initialised at {account['lastTransactionID']}")
+        return self.checkpoint
+
+    def handle(self, txn: dict):
+        txn_id = txn.get("id")
+        checkpoint = self.checkpoint
+        if txn_id is None or (checkpoint is not None and int(txn_id) <= int(checkpoint)):
+            return
+        pnls = []
+        if txn.get("type") == "ORDER_FILL":
+            closed = list(txn.get("tradesClosed") or [])
+            if txn.get("tradeReduced"):
+                closed.append(txn["tradeReduced"])
+            pnls = [float(trade.get("realizedPL", 0)) for trade in closed]
+        if pnls:
+            self.position_sizer.record_closes(txn.get("instrument"), pnls, txn_id)
+        else:
+            self.position_sizer.set_transaction_checkpoint(txn_id)
+        self.processed += 1
+        for callback in self.listeners:
+            try:
+                callback(txn)
+            except Exception as e:
+                logger.error(f"Transaction listener failed: {e}")
+
+    async def catch_up(self) -> bool:
+        checkpoint = await self._initial_checkpoint()
+        if checkpoint is None:
+            return False
+        result = await self.oanda.get_transactions_since(checkpoint)
+        if result is None:
+            return False
+        transactions, last_id = result
+        for txn in sorted(transactions, key=lambda t: int(t["id"])):
+            self.handle(txn)
+        if transactions:
+            logger.info(f"Ingested {len(transactions)} transactions up to {last_id}")
+        return True
+
+    async def _follow_stream(self):
+        url = f"{self.oanda.stream_url}/accounts/{self.oanda.account_id}/transactions/stream"
+        timeout = httpx.Timeout(10.0, read=self.heartbeat_timeout)
+        async with self.oanda.client.stream("GET", url, timeout=timeout) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise RuntimeError(f"transaction stream returned {response.status_code}: {body[:200]!r}")
+            # Anything committed between the catch-up and the stream opening
+            await self.catch_up()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                txn = json.loads(line)
+                if txn.get("type") == "HEARTBEAT":
+                    last_id = txn.get("lastTransactionID")
+                    checkpoint = self.checkpoint
+                    if last_id is not None and checkpoint is not None and int(last_id) > int(checkpoint):
+                        # Heartbeat says we are behind (e.g. a line was lost); resync over REST
+                        await self.catch_up()
+                    continue
+                self.handle(txn)
+
+    async def _run(self):
+        backoff = Backoff(self.min_backoff, self.max_backoff)
+        while True:
+            backoff.attempt()
+            try:
+                if await self.catch_up():
+                    if self.use_stream:
+                        await self._follow_stream()
+                        logger.warning("Transaction stream ended, reconnecting")
+                    else:
+                        backoff.reset()
+                        await asyncio.sleep(self.poll_interval)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Transaction ingestion error: {e}")
+            await backoff.sleep()